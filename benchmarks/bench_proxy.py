@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import ssl
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import multiprocessing
+import typing as t
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY = os.path.join(ROOT, 'scripts', 'proxy.py')
+
+CHUNK = 65536
+
+
+async def handle_upstream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        mode = await reader.readexactly(1)
+
+        if mode == b'e':
+            while True:
+                data = await reader.read(CHUNK)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        else:
+            # Flood: push data as fast as the proxy accepts it, like a large download.
+            payload = b'x' * CHUNK
+            while True:
+                writer.write(payload)
+                await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve_upstream(port: int) -> None:
+    async def serve():
+        server = await asyncio.start_server(handle_upstream, '127.0.0.1', port, backlog=4096)
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+    raise TimeoutError('Port %d did not open' % port)
+
+
+def process_stats(pid: int) -> t.Dict[str, float]:
+    with open('/proc/%d/stat' % pid) as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+
+    rss = 0
+    with open('/proc/%d/status' % pid) as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1])
+
+    return {
+        'cpu': (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK'),
+        'rss_mb': rss / 1024,
+        'threads': int(fields[17]),
+    }
+
+
+def percentile(values: t.List[float], q: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def open_tunnel(
+    port: int, upstream: int, mode: bytes
+) -> t.Tuple[asyncio.StreamReader, asyncio.StreamWriter, float]:
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b'CONNECT 127.0.0.1:%d HTTP/1.1\r\n\r\n' % upstream)
+    await reader.readuntil(b'\r\n\r\n')
+    latency = time.perf_counter() - start
+
+    writer.write(mode)
+    return reader, writer, latency
+
+
+async def echo_tunnel(port: int, upstream: int, size: int) -> float:
+    reader, writer, latency = await open_tunnel(port, upstream, b'e')
+    payload = b'x' * CHUNK
+
+    async def send():
+        sent = 0
+        while sent < size:
+            writer.write(payload[: size - sent])
+            sent += min(CHUNK, size - sent)
+            await writer.drain()
+
+    async def receive():
+        received = 0
+        while received < size:
+            data = await reader.read(CHUNK)
+            if not data:
+                raise ConnectionError('Tunnel closed early')
+            received += len(data)
+
+    await asyncio.gather(send(), receive())
+    writer.close()
+    return latency
+
+
+async def run_echo(port: int, upstream: int, tunnels: int, size: int) -> t.Dict[str, t.Any]:
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(echo_tunnel(port, upstream, size) for _ in range(tunnels)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+
+    latencies = [result for result in results if isinstance(result, float)]
+    return {
+        'tunnels': tunnels,
+        'errors': len(results) - len(latencies),
+        'seconds': round(elapsed, 4),
+        'mb_per_sec': round(len(latencies) * size * 2 / elapsed / 1e6, 1),
+        'connect_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'connect_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+async def run_flood(port: int, upstream: int, tunnels: int, pid: int, hold: float) -> float:
+    # Clients that never read: the upstream keeps sending, so RSS shows how much the proxy buffers.
+    streams = [await open_tunnel(port, upstream, b'f') for _ in range(tunnels)]
+    await asyncio.sleep(hold)
+    rss = process_stats(pid)['rss_mb']
+
+    for _, writer, _ in streams:
+        writer.close()
+
+    return rss
+
+
+def bench_engine(name: str, port: int, args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    # 'epoll+splice' runs the epoll engine with the zero-copy relay.
+    engine, _, relay = name.partition('+')
+    command = [
+        sys.executable,
+        PROXY,
+        '--http',
+        '--port',
+        str(port),
+        '--engine',
+        engine,
+        '--backlog',
+        '4096',
+        '--relay',
+        relay or 'copy',
+        '--log',
+        'ERROR',
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        wait_for_port(port)
+        before = process_stats(process.pid)
+
+        result = asyncio.run(run_echo(port, args.upstream_port, args.tunnels, args.bytes))
+
+        after = process_stats(process.pid)
+        result['proxy_cpu_seconds'] = round(after['cpu'] - before['cpu'], 3)
+        relayed = args.tunnels * args.bytes * 2 / 1e9
+        result['cpu_seconds_per_gb'] = round(result['proxy_cpu_seconds'] / relayed, 3)
+        result['proxy_threads_peak'] = after['threads']
+        result['proxy_rss_mb'] = round(after['rss_mb'], 1)
+
+        if args.flood_tunnels > 0:
+            result['flood_rss_mb'] = round(
+                asyncio.run(
+                    run_flood(
+                        port, args.upstream_port, args.flood_tunnels, process.pid, args.flood_hold
+                    )
+                ),
+                1,
+            )
+    finally:
+        process.terminate()
+        process.wait()
+
+    result['engine'] = name
+    return result
+
+
+def measure_handshakes(port: int, count: int, resume: bool) -> t.Tuple[t.List[float], int]:
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+
+    session, latencies, resumed = None, [], 0
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        start = time.perf_counter()
+        conn = context.wrap_socket(sock, session=session if resume else None)
+        latencies.append(time.perf_counter() - start)
+
+        # TLS 1.3 tickets arrive after the handshake, so read a reply before saving the session.
+        conn.sendall(b'CONNECT 127.0.0.1:1 HTTP/1.1\r\n\r\n')
+        try:
+            conn.recv(1024)
+        except OSError:
+            pass
+
+        resumed += conn.session_reused
+        session = conn.session
+        conn.close()
+
+    return latencies, resumed
+
+
+def bench_tls(engine: str, port: int, args: argparse.Namespace) -> t.Dict[str, t.Any]:
+    command = [sys.executable, PROXY, '--https', '--cert', args.cert, '--port', str(port)]
+    command += ['--engine', engine, '--backlog', '4096', '--log', 'ERROR']
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        wait_for_port(port)
+        full, _ = measure_handshakes(port, args.handshakes, False)
+        resumed, count = measure_handshakes(port, args.handshakes, True)
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        'engine': engine,
+        'handshakes': args.handshakes,
+        'full_p50_ms': round(percentile(full, 0.50) * 1000, 3),
+        'resumed_p50_ms': round(percentile(resumed, 0.50) * 1000, 3),
+        'resumption_rate': round(count / args.handshakes, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Proxy engine benchmark')
+    parser.add_argument(
+        '--engines',
+        default='thread,epoll,asyncio,thread+splice,epoll+splice',
+        help='Engines to compare, with an optional +splice relay',
+    )
+    parser.add_argument('--port', type=int, default=9180, help='First proxy port')
+    parser.add_argument('--upstream-port', type=int, default=9122, help='Upstream server port')
+    parser.add_argument('--tunnels', type=int, default=200, help='Concurrent echo tunnels')
+    parser.add_argument('--bytes', type=int, default=1 << 20, help='Bytes echoed per tunnel')
+    parser.add_argument('--flood-tunnels', type=int, default=4, help='Non-reading clients')
+    parser.add_argument('--flood-hold', type=float, default=1.0, help='Seconds to flood')
+    parser.add_argument('--cert', help='PEM with key and certificate for the TLS benchmark')
+    parser.add_argument('--handshakes', type=int, default=200, help='TLS handshakes per run')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    upstream = multiprocessing.Process(target=serve_upstream, args=(args.upstream_port,))
+    upstream.daemon = True
+    upstream.start()
+
+    try:
+        wait_for_port(args.upstream_port)
+        engines = args.engines.split(',')
+        results = [bench_engine(engine, args.port + i, args) for i, engine in enumerate(engines)]
+
+        tls = []
+        if args.cert:
+            names = [name for name in engines if '+' not in name]
+            port = args.port + len(engines)
+            tls = [bench_tls(name, port + i, args) for i, name in enumerate(names)]
+    finally:
+        upstream.terminate()
+        upstream.join()
+
+    report = {
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'params': {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ('output', 'port', 'upstream_port', 'cert')
+        },
+        'results': results,
+        'tls': tls,
+    }
+
+    data = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+
+    print(data)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import platform
+import threading
+import multiprocessing
+import typing as t
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_check  # noqa: E402
+
+from fake_env import FakeEnvironment  # noqa: E402
+
+ENGINES = {
+    'thread': user_check.Server,
+    'asyncio': user_check.AsyncServer,
+}
+
+
+def serve(
+    engine: str,
+    port: int,
+    workers: int,
+    processes: int,
+    interval: float,
+    env: t.Optional[FakeEnvironment],
+) -> None:
+    logging.disable(logging.INFO)
+
+    if env:
+        env.apply()
+
+    def target():
+        collector = user_check.StateCollector(interval) if interval > 0 else None
+        if collector:
+            collector.update()
+
+        ENGINES[engine]('127.0.0.1', port, workers, collector, processes > 1).run()
+
+    if processes > 1:
+        user_check.OpenVPNManagementClient.persistent = False
+        user_check.ProcessSupervisor(processes, target).run()
+    else:
+        target()
+
+
+def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+    raise TimeoutError('Server did not start on port %d' % port)
+
+
+def process_tree_cpu(pid: int) -> float:
+    total = 0.0
+    ticks = os.sysconf('SC_CLK_TCK')
+    pending = [pid]
+
+    while pending:
+        current = pending.pop()
+        try:
+            with open('/proc/%d/stat' % current) as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            total += (int(fields[11]) + int(fields[12])) / ticks
+
+            for task in os.listdir('/proc/%d/task' % current):
+                with open('/proc/%d/task/%s/children' % (current, task)) as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except (OSError, ValueError, IndexError):
+            continue
+
+    return total
+
+
+def read_response(sock: socket.socket, buffer: bytes) -> t.Tuple[bytes, bytes]:
+    while b'\r\n\r\n' not in buffer:
+        data = sock.recv(65536)
+        if not data:
+            return buffer, b''
+        buffer += data
+
+    head, _, rest = buffer.partition(b'\r\n\r\n')
+    length = 0
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length':
+            length = int(value.strip())
+
+    while len(rest) < length:
+        data = sock.recv(65536)
+        if not data:
+            break
+        rest += data
+
+    return head + b'\r\n\r\n' + rest[:length], rest[length:]
+
+
+class LoadClient(threading.Thread):
+    def __init__(self, port: int, requests: int, paths: t.List[str], keep_alive: bool):
+        super().__init__()
+        self.port = port
+        self.requests = requests
+        self.paths = paths
+        self.keep_alive = keep_alive
+
+        self.latencies = {}
+        self.errors = 0
+
+    def run(self) -> None:
+        sock = None
+        buffer = b''
+
+        for i in range(self.requests):
+            path = self.paths[i % len(self.paths)]
+            command = path.split('/')[1]
+            request = 'GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path
+            start = time.perf_counter()
+
+            try:
+                if sock is None:
+                    sock = socket.create_connection(('127.0.0.1', self.port))
+                    buffer = b''
+
+                sock.sendall(request.encode())
+                response, buffer = read_response(sock, buffer)
+                if not response.startswith(b'HTTP/1.1 200'):
+                    raise ConnectionError('Bad response')
+
+                if not self.keep_alive or b'Connection: close' in response:
+                    sock.close()
+                    sock = None
+            except OSError:
+                self.errors += 1
+                if sock:
+                    sock.close()
+                sock = None
+                continue
+
+            self.latencies.setdefault(command, []).append(time.perf_counter() - start)
+
+        if sock:
+            sock.close()
+
+
+def percentile(values: t.List[float], q: float) -> float:
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def summarize(latencies: t.List[float], elapsed: float) -> t.Dict[str, t.Any]:
+    return {
+        'requests': len(latencies),
+        'req_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def build_paths(usernames: t.List[str], count: int, kill_ratio: float) -> t.List[str]:
+    paths = []
+    for _ in range(count):
+        command = 'KILL' if random.random() < kill_ratio else 'CHECK'
+        paths.append('/%s/%s' % (command, random.choice(usernames)))
+    return paths
+
+
+def run_load(
+    port: int,
+    server_pid: int,
+    concurrency: int,
+    requests: int,
+    paths: t.List[str],
+    keep_alive: bool,
+) -> t.Dict[str, t.Any]:
+    clients = []
+    for i in range(concurrency):
+        offset = i * requests % len(paths)
+        clients.append(LoadClient(port, requests, paths[offset:] + paths[:offset], keep_alive))
+
+    cpu = process_tree_cpu(server_pid)
+    start = time.perf_counter()
+
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    elapsed = time.perf_counter() - start
+    cpu = process_tree_cpu(server_pid) - cpu
+
+    by_command = {}
+    for client in clients:
+        for command, values in client.latencies.items():
+            by_command.setdefault(command, []).extend(values)
+
+    latencies = [value for values in by_command.values() for value in values]
+    result = summarize(latencies, elapsed)
+    result.update(
+        {
+            'errors': sum(client.errors for client in clients),
+            'seconds': round(elapsed, 4),
+            'server_cpu_seconds': round(cpu, 3),
+            'cpu_ms_per_request': round(cpu * 1000 / len(latencies), 4) if latencies else None,
+            'commands': {
+                command: summarize(values, elapsed) for command, values in by_command.items()
+            },
+        }
+    )
+    return result
+
+
+def bench_engine(
+    engine: str,
+    port: int,
+    args: argparse.Namespace,
+    env: t.Optional[FakeEnvironment],
+) -> t.Dict[str, t.Any]:
+    process = multiprocessing.Process(
+        target=serve,
+        args=(engine, port, args.workers, args.processes, args.interval, env),
+    )
+    process.daemon = True
+    process.start()
+
+    try:
+        wait_for_port(port)
+        usernames = env.usernames if env else args.usernames.split(',')
+        paths = build_paths(usernames, max(args.requests, 1000), args.kill_ratio)
+        keep_alive = engine != 'thread'
+        result = run_load(port, process.pid, args.concurrency, args.requests, paths, keep_alive)
+    finally:
+        process.terminate()
+        process.join()
+
+    result['engine'] = engine
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checker server load benchmark')
+    parser.add_argument('--engines', default='thread,asyncio', help='Engines to compare')
+    parser.add_argument('--port', type=int, default=5990, help='First port to bind')
+    parser.add_argument('--workers', type=int, default=10, help='Server workers')
+    parser.add_argument('--processes', type=int, default=1, help='Server processes')
+    parser.add_argument('--interval', type=float, default=1.0, help='Collector interval (0=off)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per client')
+    parser.add_argument('--kill-ratio', type=float, default=0.0, help='Share of KILL requests')
+    parser.add_argument('--users', type=int, default=1000, help='Fake users')
+    parser.add_argument('--sessions', type=int, default=2, help='Fake SSH sessions per user')
+    parser.add_argument('--openvpn-clients', type=int, default=2000, help='Fake OpenVPN clients')
+    parser.add_argument('--management-port', type=int, default=7599, help='Fake management port')
+    parser.add_argument(
+        '--real-env',
+        action='store_true',
+        help='Check the real system instead of a fake environment',
+    )
+    parser.add_argument('--usernames', default='root', help='Usernames used with --real-env')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    env = None
+    if not args.real_env:
+        env = FakeEnvironment(
+            users=args.users,
+            sessions=args.sessions,
+            openvpn_clients=args.openvpn_clients,
+            management_port=args.management_port,
+        ).setup()
+
+    try:
+        if env:
+            wait_for_port(args.management_port)
+
+        results = [
+            bench_engine(engine, args.port + i, args, env)
+            for i, engine in enumerate(args.engines.split(','))
+        ]
+    finally:
+        if env:
+            env.teardown()
+
+    report = {
+        'version': user_check.__version__,
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'params': {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ('output', 'port', 'management_port')
+        },
+        'results': results,
+    }
+
+    data = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(data + '\n')
+
+    print(data)
+
+
+if __name__ == '__main__':
+    main()
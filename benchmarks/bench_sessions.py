@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import ctypes
+import shutil
+import signal
+import socket
+import argparse
+import tempfile
+import multiprocessing
+import typing as t
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_check  # noqa: E402
+
+from fake_env import UID_BASE, create_proc_tree  # noqa: E402
+
+
+def bench_proc(path: str, users: int) -> float:
+    index = user_check.ProcessIndex(path)
+
+    start = time.perf_counter()
+    sessions = index.refresh(force=True)
+    for uid in range(UID_BASE, UID_BASE + users):
+        items = sessions.get(uid, [])
+        len(items)
+        [session.pid for session in items]
+        min((session.started_at for session in items), default=None)
+
+    return time.perf_counter() - start
+
+
+def bench_popen(username: str, users: int) -> float:
+    start = time.perf_counter()
+    for _ in range(users):
+        os.popen('ps -u %s' % username).readlines()
+        os.popen('ps -u %s' % username).readlines()
+        os.popen('ps -u %s -o etime --no-headers' % username).readlines()
+
+    return time.perf_counter() - start
+
+
+def serve_sshd(port: int, users: int) -> None:
+    # Mimic sshd: a process named sshd forks one child per connection that drops to the user.
+    os.setpgrp()
+    ctypes.CDLL(None).prctl(15, b'sshd', 0, 0, 0)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', port))
+    sock.listen(1024)
+
+    count = 0
+    while True:
+        conn, _ = sock.accept()
+        if os.fork() == 0:
+            sock.close()
+            os.setuid(UID_BASE + count % users)
+            signal.pause()
+            os._exit(0)
+
+        conn.close()
+        count += 1
+
+
+def timed(function: t.Callable[[], t.Any]) -> t.Tuple[float, t.Any]:
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def count_sessions(sessions: t.Dict[int, t.List[t.Any]], users: int) -> int:
+    return sum(len(sessions.get(uid, [])) for uid in range(UID_BASE, UID_BASE + users))
+
+
+def bench_live(port: int, users: int, connections: int) -> t.Dict[str, t.Any]:
+    server = multiprocessing.Process(target=serve_sshd, args=(port, users), daemon=True)
+    server.start()
+    clients = []
+
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.5).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+
+        clients = [socket.create_connection(('127.0.0.1', port)) for _ in range(connections)]
+
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            if count_sessions(user_check.ProcessIndex().scan(), users) > connections:
+                break
+            time.sleep(0.1)
+
+        netlink_time, netlink = timed(
+            lambda: user_check.SocketIndex(ports=[port]).refresh(force=True)
+        )
+        proc_time, proc = timed(lambda: user_check.ProcessIndex().refresh(force=True))
+        popen_time, _ = timed(
+            lambda: [
+                os.popen('ps -u %d --no-headers' % uid).readlines()
+                for uid in range(UID_BASE, UID_BASE + users)
+            ]
+        )
+    finally:
+        for client in clients:
+            client.close()
+
+        os.killpg(server.pid, signal.SIGKILL)
+        server.join()
+
+    # Each established connection is one session, the probe connection included.
+    return {
+        'connections': connections,
+        'netlink_seconds': round(netlink_time, 6),
+        'netlink_sessions': count_sessions(netlink, users),
+        'proc_index_seconds': round(proc_time, 6),
+        'proc_index_sessions': count_sessions(proc, users),
+        'popen_seconds': round(popen_time, 6),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SSH session collector benchmark')
+    parser.add_argument('--users', type=int, default=200, help='Number of users')
+    parser.add_argument('--sessions', type=int, default=2, help='Sessions per user')
+    parser.add_argument('--others', type=int, default=500, help='Unrelated processes')
+    parser.add_argument('--popen-user', default='root', help='User passed to ps -u')
+    parser.add_argument(
+        '--connections',
+        type=int,
+        default=200,
+        help='Live loopback SSH-like connections for the netlink comparison (needs root, 0=off)',
+    )
+    parser.add_argument('--port', type=int, default=2299, help='Port of the fake sshd')
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix='proc-')
+    try:
+        create_proc_tree(path, args.users, args.sessions, args.others)
+
+        proc_time = bench_proc(path, args.users)
+        popen_time = bench_popen(args.popen_user, args.users)
+    finally:
+        shutil.rmtree(path)
+
+    report = {
+        'users': args.users,
+        'processes': args.users * args.sessions + args.others,
+        'proc_index_seconds': round(proc_time, 6),
+        'popen_seconds': round(popen_time, 6),
+        'speedup': round(popen_time / proc_time, 1) if proc_time else None,
+    }
+
+    if args.connections > 0 and os.geteuid() == 0:
+        report['live'] = bench_live(args.port, args.users, args.connections)
+
+    print(json.dumps(report, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import typing as t
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_check  # noqa: E402
+
+from fake_env import generate_clients, render_status  # noqa: E402
+
+
+def expected_counts(clients: t.List[t.Tuple[str, str]]) -> t.Dict[str, int]:
+    counts = {}
+    for name, _ in clients:
+        counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def check(log: user_check.OpenVPNStatusLog, clients: t.List[t.Tuple[str, str]]) -> float:
+    start = time.perf_counter()
+    sessions = log.get_sessions()
+    elapsed = time.perf_counter() - start
+
+    counts = {name: len(items) for name, items in sessions.items()}
+    if counts != expected_counts(clients):
+        raise AssertionError('Parsed counts do not match the generated status file')
+
+    return elapsed
+
+
+def bench_version(path: str, version: int, users: int, clients: int) -> t.Dict[str, t.Any]:
+    rows = generate_clients(users, clients)
+    with open(path, 'w') as f:
+        f.write(render_status(version, rows, 'Thu Jun 18 08:12:15 2015'))
+
+    log = user_check.OpenVPNStatusLog(path)
+    result = {'version': version, 'bytes': os.path.getsize(path)}
+    result['cold_seconds'] = check(log, rows)
+    result['unchanged_seconds'] = check(log, rows)
+
+    # v2/v3 lines are self-describing, so trailing rows can be appended in place.
+    if version > 1:
+        extra = generate_clients(users, 100)
+        with open(path, 'a') as f:
+            f.write(render_status(version, extra, 'x').split('\n', 3)[3].split('HEADER')[0])
+        result['append_seconds'] = check(log, rows + extra)
+
+    rotated = generate_clients(users, clients // 2)
+    with open(path + '.new', 'w') as f:
+        f.write(render_status(version, rotated, 'Thu Jun 18 08:13:15 2015'))
+    os.replace(path + '.new', path)
+    result['rotate_seconds'] = check(log, rotated)
+
+    start = time.perf_counter()
+    with open(path) as f:
+        data = f.read()
+    for name in expected_counts(rotated):
+        data.count(name)
+    result['str_count_seconds'] = time.perf_counter() - start
+
+    return {k: round(v, 6) if isinstance(v, float) else v for k, v in result.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenVPN status log index benchmark')
+    parser.add_argument('--users', type=int, default=2000, help='Distinct common names')
+    parser.add_argument('--clients', type=int, default=40000, help='Connected clients')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        results = []
+        for version in (1, 2, 3):
+            log_path = os.path.join(path, 'status-v%d.log' % version)
+            results.append(bench_version(log_path, version, args.users, args.clients))
+
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
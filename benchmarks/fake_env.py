@@ -0,0 +1,203 @@
+import os
+import sys
+import time
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import multiprocessing
+import typing as t
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import user_check  # noqa: E402
+
+# Above the kernel's maximum pid_max (2^22), so a KILL against the fake tree
+# can never signal a real process.
+PID_BASE = 5000000
+UID_BASE = 1000
+
+DATE = 'Thu Jun 18 04:23:03 2015'
+V2_COLUMNS = [
+    'Common Name',
+    'Real Address',
+    'Virtual Address',
+    'Virtual IPv6 Address',
+    'Bytes Received',
+    'Bytes Sent',
+    'Connected Since',
+    'Connected Since (time_t)',
+    'Username',
+    'Client ID',
+    'Peer ID',
+    'Data Channel Cipher',
+]
+
+
+def create_proc_tree(path: str, users: int, sessions: int, others: int) -> None:
+    boot_time = int(time.time()) - 86400
+    with open(os.path.join(path, 'stat'), 'w') as f:
+        f.write('cpu  0 0 0 0 0 0 0 0 0 0\nbtime %d\n' % boot_time)
+
+    processes = [('sshd', UID_BASE + (i % users)) for i in range(users * sessions)]
+    processes += [(random.choice(['bash', 'nginx', 'openvpn', 'cron']), 0) for _ in range(others)]
+    random.shuffle(processes)
+
+    for pid, (name, uid) in enumerate(processes, start=PID_BASE):
+        pid_path = os.path.join(path, str(pid))
+        os.makedirs(pid_path)
+
+        start_ticks = random.randint(100, 86400 * 100)
+        fields = ['S'] + ['0'] * 18 + [str(start_ticks)] + ['0'] * 30
+
+        with open(os.path.join(pid_path, 'stat'), 'w') as f:
+            f.write('%d (%s) %s\n' % (pid, name, ' '.join(fields)))
+
+        with open(os.path.join(pid_path, 'status'), 'w') as f:
+            f.write('Name:\t%s\nUid:\t%d\t%d\t%d\t%d\n' % (name, uid, uid, uid, uid))
+
+
+def generate_clients(users: int, clients: int) -> t.List[t.Tuple[str, str]]:
+    names = ['user%d' % i for i in range(users)]
+    return [
+        (random.choice(names), '10.%d.%d.%d:%d' % (i >> 16 & 255, i >> 8 & 255, i & 255, 1024 + i))
+        for i in range(clients)
+    ]
+
+
+def render_status(version: int, clients: t.List[t.Tuple[str, str]], updated: str) -> str:
+    if version == 1:
+        lines = ['OpenVPN CLIENT LIST', 'Updated,%s' % updated]
+        lines.append('Common Name,Real Address,Bytes Received,Bytes Sent,Connected Since')
+        lines += ['%s,%s,1024,2048,%s' % (name, addr, DATE) for name, addr in clients]
+        lines += ['ROUTING TABLE', 'Virtual Address,Common Name,Real Address,Last Ref']
+        lines += ['10.8.0.%d,%s,%s,%s' % (i % 250, n, a, DATE) for i, (n, a) in enumerate(clients)]
+        lines += ['GLOBAL STATS', 'Max bcast/mcast queue length,0', 'END']
+        return '\n'.join(lines) + '\n'
+
+    sep = ',' if version == 2 else '\t'
+    lines = [sep.join(['TITLE', 'OpenVPN 2.5']), sep.join(['TIME', updated, '0'])]
+    lines.append(sep.join(['HEADER', 'CLIENT_LIST'] + V2_COLUMNS))
+
+    for i, (name, addr) in enumerate(clients):
+        row = [name, addr, '10.8.0.%d' % (i % 250), '', '1024', '2048', DATE, '1434601383']
+        row += [name, str(i), str(i), 'AES-256-GCM']
+        lines.append(sep.join(['CLIENT_LIST'] + row))
+
+    lines.append(sep.join(['HEADER', 'ROUTING_TABLE', 'Virtual Address', 'Common Name']))
+    lines += [sep.join(['ROUTING_TABLE', '10.8.0.1', name]) for name, _ in clients]
+    lines += [sep.join(['GLOBAL_STATS', 'Max bcast/mcast queue length', '0']), 'END']
+    return '\n'.join(lines) + '\n'
+
+
+def serve_management(port: int, status: bytes) -> None:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', port))
+    sock.listen(128)
+
+    def handle(conn: socket.socket) -> None:
+        with conn, conn.makefile('rb') as f:
+            conn.sendall(b'>INFO:OpenVPN Management Interface Version 3\r\n')
+            for line in f:
+                if line.startswith(b'status'):
+                    conn.sendall(status)
+                elif line.startswith(b'kill'):
+                    conn.sendall(b'SUCCESS: common name found, 1 client(s) killed\r\n')
+                elif line.startswith(b'client-kill'):
+                    conn.sendall(b'SUCCESS: client-kill command succeeded\r\n')
+                else:
+                    conn.sendall(b'ERROR: unknown command\r\n')
+
+    while True:
+        conn, _ = sock.accept()
+        threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+class FakeEnvironment:
+    def __init__(
+        self,
+        users: int = 1000,
+        sessions: int = 2,
+        others: int = 500,
+        openvpn_clients: int = 2000,
+        management_port: int = 7599,
+    ):
+        self.users = users
+        self.sessions = sessions
+        self.others = others
+        self.openvpn_clients = openvpn_clients
+        self.management_port = management_port
+
+        self.path = None
+        self.status = b''
+        self.management = None
+
+    @property
+    def usernames(self) -> t.List[str]:
+        return ['user%d' % i for i in range(self.users)]
+
+    def create_files(self) -> None:
+        today = int(time.time() // 86400)
+
+        with open(os.path.join(self.path, 'passwd'), 'w') as f:
+            f.write('root:x:0:0:root:/root:/bin/bash\n')
+            for i, name in enumerate(self.usernames):
+                uid = UID_BASE + i
+                f.write('%s:x:%d:%d::/home/%s:/bin/false\n' % (name, uid, uid, name))
+
+        with open(os.path.join(self.path, 'shadow'), 'w') as f:
+            f.write('root:*:19000:0:99999:7:::\n')
+            for name in self.usernames:
+                f.write('%s:!:19000:0:99999:7::%d:\n' % (name, today + random.randint(-5, 60)))
+
+        with open(os.path.join(self.path, 'usuarios.db'), 'w') as f:
+            for name in self.usernames:
+                f.write('%s %d\n' % (name, random.randint(1, 4)))
+
+        os.makedirs(os.path.join(self.path, 'openvpn'))
+        clients = generate_clients(self.users, self.openvpn_clients)
+        with open(os.path.join(self.path, 'openvpn', 'openvpn.log'), 'w') as f:
+            f.write(render_status(2, clients, DATE))
+
+        self.status = render_status(2, clients, DATE).replace('\n', '\r\n').encode()
+
+    def setup(self) -> 'FakeEnvironment':
+        self.path = tempfile.mkdtemp(prefix='checker-env-')
+
+        os.makedirs(os.path.join(self.path, 'proc'))
+        create_proc_tree(os.path.join(self.path, 'proc'), self.users, self.sessions, self.others)
+        self.create_files()
+
+        self.management = multiprocessing.Process(
+            target=serve_management,
+            args=(self.management_port, self.status),
+        )
+        self.management.daemon = True
+        self.management.start()
+        return self
+
+    def teardown(self) -> None:
+        if self.management:
+            self.management.terminate()
+            self.management.join()
+
+        if self.path:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def apply(self) -> None:
+        user_check.ProcessIndex.PATH = os.path.join(self.path, 'proc')
+        user_check.PasswdIndex.PATH = os.path.join(self.path, 'passwd')
+        user_check.ShadowExpirationIndex.PATH = os.path.join(self.path, 'shadow')
+        user_check.ConnectionLimitIndex.PATH = os.path.join(self.path, 'usuarios.db')
+
+        user_check.OpenVPNManager.PORT = self.management_port
+        user_check.OpenVPNManager.CONFIG_PATH = os.path.join(self.path, 'openvpn')
+        user_check.OpenVPNManager.LOG_PATH = os.path.join(self.path, 'openvpn')
+
+    def __enter__(self) -> 'FakeEnvironment':
+        return self.setup()
+
+    def __exit__(self, *args) -> None:
+        self.teardown()
@@ -1,9 +1,18 @@
 import socket
 import ssl
 import select
+import asyncio
+import selectors
+import itertools
+import collections
 import threading
+import errno
+import fcntl
+import resource
+import time
 import os
 import argparse
+import functools
 import logging
 
 from urllib.parse import urlparse
@@ -22,6 +31,15 @@ usage = f'''
         HTTP:
             python3 proxy.py --http --port 80
     
+    # Engine epoll (loops de eventos em vez de uma thread por túnel):
+        python3 proxy.py --http --port 80 --engine epoll --loops 2
+
+    # Túneis HTTP sem cópia para o espaço de usuário (Linux):
+        python3 proxy.py --http --port 80 --relay splice
+
+    # HTTP e HTTPS no mesmo processo com asyncio:
+        python3 proxy.py --http --port 80 --https --https-port 443 --cert cert.pem --engine asyncio
+
     # Uso em background:
         HTTPS:
             screen -dmS proxy python3 proxy.py --https --cert cert.pem --port 443
@@ -68,12 +86,125 @@ class HttpParser:
         headers = '\r\n'.join(f'{k}: {v}' for k, v in self.headers.items()) + '\r\n' * 2
         return base.encode('utf-8') + headers.encode('utf-8') + self.body.encode('utf-8')
 
+    @property
+    def remote_address(self) -> Tuple[str, int]:
+        if self.method == 'CONNECT':
+            host, port = self.url.path.split(':')
+        elif self.url.hostname or self.headers.get('Host'):
+            host, port = (
+                self.url.hostname if not self.headers.get('Host') else self.headers['Host'],
+                self.url.port or REMOTE_ADDRESS[1],
+            )
+        else:
+            raise ValueError('Invalid URL')
+
+        return host, int(port)
+
+    @property
+    def is_tunnel(self) -> bool:
+        return self.method == 'CONNECT' or self.remote_address[1] in (22, 443, 1194)
+
+
+def wait(
+    rlist: List[socket.socket], wlist: List[socket.socket], timeout: float
+) -> Tuple[List[socket.socket], List[socket.socket]]:
+    # poll() instead of select(): splice pipes push descriptors past FD_SETSIZE much sooner.
+    poller = select.poll()
+    for sock in rlist:
+        poller.register(sock, select.POLLIN)
+    for sock in wlist:
+        poller.register(sock, select.POLLOUT | (select.POLLIN if sock in rlist else 0))
+
+    ready = dict(poller.poll(timeout * 1000))
+    errors = select.POLLHUP | select.POLLERR
+
+    r = [sock for sock in rlist if ready.get(sock.fileno(), 0) & (select.POLLIN | errors)]
+    w = [sock for sock in wlist if ready.get(sock.fileno(), 0) & (select.POLLOUT | errors)]
+    return r, w
+
+
+class ChunkBuffer:
+    CHUNK_SIZE = 65536
+
+    def __init__(self, high: int, low: int) -> None:
+        self.high = high
+        self.low = low
+        self.full = False
+
+        self.peak = 0
+        self.total = 0
+        self.pauses = 0
+
+        self.__chunks = collections.deque()
+        self.__size = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def stats(self) -> dict:
+        return {
+            'buffered': self.__size,
+            'peak': self.peak,
+            'total': self.total,
+            'pauses': self.pauses,
+        }
+
+    def append(self, data: bytes) -> None:
+        self.__chunks.append(memoryview(data))
+        self.__size += len(data)
+        self.total += len(data)
+        self.peak = max(self.peak, self.__size)
+
+        if not self.full and self.__size >= self.high:
+            self.full = True
+            self.pauses += 1
+
+    def peek(self) -> memoryview:
+        chunk = self.__chunks[0]
+        if len(chunk) >= self.CHUNK_SIZE or len(self.__chunks) == 1:
+            return chunk
+
+        # Coalesce small chunks so a trickle of tiny reads still goes out in one send().
+        parts, size = [], 0
+        while self.__chunks and size + len(self.__chunks[0]) <= self.CHUNK_SIZE:
+            chunk = self.__chunks.popleft()
+            parts.append(chunk)
+            size += len(chunk)
+
+        chunk = memoryview(b''.join(parts))
+        self.__chunks.appendleft(chunk)
+        return chunk
+
+    def consume(self, size: int) -> None:
+        self.__size -= size
+
+        while size:
+            chunk = self.__chunks[0]
+            if size < len(chunk):
+                self.__chunks[0] = chunk[size:]
+                break
+
+            size -= len(chunk)
+            self.__chunks.popleft()
+
+        if self.full and self.__size <= self.low:
+            self.full = False
+
+    def clear(self) -> None:
+        self.__chunks.clear()
+        self.__size = 0
+        self.full = False
+
 
 class Connection:
+    HIGH_WATERMARK = 1 << 18
+    LOW_WATERMARK = 1 << 16
+
     def __init__(self, conn: Union[socket.socket, ssl.SSLSocket], addr: Tuple[str, int]):
         self.__conn = conn
         self.__addr = addr
-        self.__buffer = b''
+        self.__buffer = ChunkBuffer(self.HIGH_WATERMARK, self.LOW_WATERMARK)
         self.__closed = False
 
     @property
@@ -105,12 +236,14 @@ class Connection:
         self.__addr = addr
 
     @property
-    def buffer(self) -> bytes:
+    def buffer(self) -> ChunkBuffer:
         return self.__buffer
 
     @buffer.setter
     def buffer(self, data: bytes) -> None:
-        self.__buffer = data
+        self.__buffer.clear()
+        if data:
+            self.__buffer.append(data)
 
     @property
     def closed(self) -> bool:
@@ -121,6 +254,12 @@ class Connection:
         self.__closed = value
 
     def close(self):
+        stats = self.__buffer.stats
+        logger.debug(
+            f'{self} Buffer: pico {stats["peak"]} Bytes, total {stats["total"]} Bytes, '
+            f'pausas {stats["pauses"]}'
+        )
+
         self.conn.close()
         self.closed = True
 
@@ -144,12 +283,15 @@ class Connection:
         if len(data) <= 0:
             raise ValueError('Queue data is empty')
 
-        self.__buffer += data
+        self.__buffer.append(data)
         return len(data)
 
     def flush(self) -> int:
-        sent = self.write(self.__buffer)
-        self.__buffer = self.__buffer[sent:]
+        if not self.__buffer:
+            return 0
+
+        sent = self.write(self.__buffer.peek())
+        self.__buffer.consume(sent)
         return sent
 
 
@@ -173,6 +315,179 @@ class Server(Connection):
 
         logger.info(f'{self} Conexão estabelecida')
 
+    def connect_nonblocking(self, addr: Tuple[str, int] = None) -> None:
+        self.addr = addr or self.addr
+        self.conn.setblocking(False)
+
+        error = self.conn.connect_ex(self.addr)
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            raise OSError(error, os.strerror(error))
+
+    def finish_connect(self) -> None:
+        error = self.conn.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            raise OSError(error, os.strerror(error))
+
+        logger.info(f'{self} Conexão estabelecida')
+
+
+class Splice:
+    ENABLED = False
+    SIZE = 1 << 18
+    FLAGS = getattr(os, 'SPLICE_F_MOVE', 0) | getattr(os, 'SPLICE_F_NONBLOCK', 0)
+
+    def __init__(self, source: Connection, target: Connection) -> None:
+        self.source = source
+        self.target = target
+
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        os.set_blocking(self.write_fd, False)
+
+        try:
+            self.size = fcntl.fcntl(self.write_fd, fcntl.F_SETPIPE_SZ, self.SIZE)
+        except (AttributeError, OSError):
+            self.size = 65536
+
+        self.pending = 0
+        self.eof = False
+
+    @classmethod
+    def supports(cls, *connections: Connection) -> bool:
+        return (
+            cls.ENABLED
+            and hasattr(os, 'splice')
+            and not any(isinstance(c.conn, ssl.SSLSocket) for c in connections)
+        )
+
+    @property
+    def readable(self) -> bool:
+        return not self.eof and self.pending < self.size
+
+    @property
+    def done(self) -> bool:
+        return self.eof and not self.pending
+
+    def fill(self) -> int:
+        try:
+            size = os.splice(
+                self.source.conn.fileno(), self.write_fd, self.size - self.pending, flags=self.FLAGS
+            )
+        except BlockingIOError:
+            return 0
+
+        self.eof = size == 0
+        self.pending += size
+        return size
+
+    def drain(self) -> int:
+        try:
+            size = os.splice(
+                self.read_fd, self.target.conn.fileno(), self.pending, flags=self.FLAGS
+            )
+        except BlockingIOError:
+            return 0
+
+        self.pending -= size
+        return size
+
+    def close(self) -> None:
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+class TLSContext:
+    CHECK_INTERVAL = 5.0
+    REPORT_INTERVAL = 60.0
+
+    def __init__(self, cert: str, ciphers: Optional[str] = None) -> None:
+        self.cert = cert
+        self.ciphers = ciphers
+
+        self.context = create_ssl_context(cert, ciphers)
+        self.mtime = os.stat(cert).st_mtime
+
+        self.handshakes = 0
+        self.resumed = 0
+        self.timed = 0
+        self.handshake_seconds = 0.0
+
+        self.__checked_at = time.monotonic()
+        self.__reported_at = time.monotonic()
+        self.__lock = threading.Lock()
+        self.__reload_lock = threading.Lock()
+
+    @property
+    def stats(self) -> dict:
+        with self.__lock:
+            return {
+                'handshakes': self.handshakes,
+                'resumed': self.resumed,
+                'resumption_rate': self.resumed / self.handshakes if self.handshakes else 0.0,
+                'handshake_avg_ms': (
+                    self.handshake_seconds * 1000 / self.timed if self.timed else 0.0
+                ),
+            }
+
+    def reload(self) -> None:
+        with self.__reload_lock:
+            now = time.monotonic()
+            if now - self.__checked_at < self.CHECK_INTERVAL:
+                return
+
+            self.__checked_at = now
+
+            try:
+                mtime = os.stat(self.cert).st_mtime
+                if mtime == self.mtime:
+                    return
+
+                # Validated on a scratch context first, so a half-written file never goes live.
+                # Loading into the shared context keeps its ticket keys and cached sessions.
+                create_ssl_context(self.cert, self.ciphers)
+                self.context.load_cert_chain(certfile=self.cert, keyfile=self.cert)
+                self.mtime = mtime
+                logger.info(f'Certificado {self.cert} recarregado')
+            except (OSError, ssl.SSLError) as e:
+                logger.error(f'Falha ao recarregar o certificado {self.cert}: {e}')
+
+    def wrap_socket(self, conn: socket.socket, handshake: bool = True) -> ssl.SSLSocket:
+        self.reload()
+
+        # The SSL object copies the chain when created, so only creation has to wait for a
+        # reload; the handshake itself runs outside the lock.
+        with self.__reload_lock:
+            conn = self.context.wrap_socket(conn, server_side=True, do_handshake_on_connect=False)
+
+        if handshake:
+            conn.do_handshake()
+        return conn
+
+    def record(
+        self, ssl_object: Union[ssl.SSLSocket, ssl.SSLObject], seconds: Optional[float] = None
+    ) -> None:
+        with self.__lock:
+            self.handshakes += 1
+            self.resumed += ssl_object.session_reused
+            if seconds is not None:
+                self.timed += 1
+                self.handshake_seconds += seconds
+
+        logger.debug(
+            f'Handshake TLS{f" em {seconds * 1000:.1f} ms" if seconds is not None else ""}'
+            f'{" (sessão retomada)" if ssl_object.session_reused else ""}'
+        )
+
+        now = time.monotonic()
+        if now - self.__reported_at >= self.REPORT_INTERVAL:
+            self.__reported_at = now
+            stats = self.stats
+            logger.info(
+                f'TLS: {stats["handshakes"]} handshakes, '
+                f'{stats["resumption_rate"]:.0%} retomadas, '
+                f'média {stats["handshake_avg_ms"]:.1f} ms'
+            )
+
 
 class Proxy(threading.Thread):
     def __init__(self, client: Client, server: Optional[Server] = None) -> None:
@@ -202,27 +517,10 @@ class Proxy(threading.Thread):
 
         self.http_parser.parse(data)
 
-        if self.http_parser.method == 'CONNECT':
-            host, port = self.http_parser.url.path.split(':')
-        elif self.http_parser.url.hostname or self.http_parser.headers.get('Host'):
-            host, port = (
-                self.http_parser.url.hostname
-                if not self.http_parser.headers.get('Host')
-                else self.http_parser.headers['Host'],
-                self.http_parser.url.port or REMOTE_ADDRESS[1],
-            )
-        else:
-            raise ValueError('Invalid URL')
-
-        self.server = Server.of((host, int(port)))
+        self.server = Server.of(self.http_parser.remote_address)
         self.server.connect()
 
-        if (
-            self.http_parser.method == 'CONNECT'
-            or str(port) == '22'
-            or str(port) == '443'
-            or str(port) == '1194'
-        ):
+        if self.http_parser.is_tunnel:
             self.client.queue(DEFAULT_RESPONSE)
         else:
             self.server.queue(self.http_parser.build())
@@ -230,10 +528,15 @@ class Proxy(threading.Thread):
         logger.info(f'{self.client} -> Solicitação: {self.http_parser.build()}')
 
     def _get_waitable_lists(self) -> Tuple[List[socket.socket]]:
-        r, w, e = [self.client.conn], [], []
+        r, w, e = [], [], []
+        server = self.server if self.server and not self.server.closed else None
 
-        if self.server and not self.server.closed:
-            r.append(self.server.conn)
+        # A side whose peer is over the high watermark is not read until the peer drains.
+        if not server or not server.buffer.full:
+            r.append(self.client.conn)
+
+        if server and not self.client.buffer.full:
+            r.append(server.conn)
 
         if self.client.buffer:
             w.append(self.client.conn)
@@ -267,12 +570,48 @@ class Proxy(threading.Thread):
                 self.client.queue(data)
                 logger.debug(f'{self.server} recebeu {len(data)} Bytes')
 
+    def _can_splice(self) -> bool:
+        return (
+            self.server is not None
+            and not self.server.closed
+            and not self.client.buffer
+            and not self.server.buffer
+            and self.http_parser.is_tunnel
+            and Splice.supports(self.client, self.server)
+        )
+
+    def _splice(self) -> None:
+        self.client.conn.setblocking(False)
+        self.server.conn.setblocking(False)
+
+        pipes = [Splice(self.client, self.server), Splice(self.server, self.client)]
+        logger.debug(f'{self.client} Túnel em modo splice')
+
+        try:
+            while not any(pipe.done for pipe in pipes):
+                rlist = [pipe.source.conn for pipe in pipes if pipe.readable]
+                wlist = [pipe.target.conn for pipe in pipes if pipe.pending]
+                r, w = wait(rlist, wlist, 1)
+
+                for pipe in pipes:
+                    if pipe.target.conn in w:
+                        pipe.drain()
+                    if pipe.source.conn in r:
+                        pipe.fill()
+        finally:
+            for pipe in pipes:
+                pipe.close()
+
     def _process(self) -> None:
         self.running = True
 
         while self.running:
-            rlist, wlist, xlist = self._get_waitable_lists()
-            r, w, _ = select.select(rlist, wlist, xlist, 1)
+            if self._can_splice():
+                self._splice()
+                break
+
+            rlist, wlist, _ = self._get_waitable_lists()
+            r, w = wait(rlist, wlist, 1)
 
             self._process_wlist(w)
             self._process_rlist(r)
@@ -290,6 +629,403 @@ class Proxy(threading.Thread):
             logger.info(f'{self.client} Desconectado')
 
 
+class Tunnel:
+    def __init__(self, loop: 'EventLoop', client: Client, tls: Optional[TLSContext] = None) -> None:
+        self.loop = loop
+        self.client = client
+        self.server: Optional[Server] = None
+
+        self.http_parser = HttpParser()
+
+        self.tls = tls
+        self.handshaking = tls is not None
+        self.handshake_events = selectors.EVENT_READ
+        self.handshake_started = time.perf_counter()
+        self.connecting = False
+        self.closed = False
+
+        self.pipes: List[Splice] = []
+        self.__events = {}
+
+    def _pipe_events(self, connection: Connection) -> int:
+        events = 0
+        for pipe in self.pipes:
+            if pipe.source is connection and pipe.readable:
+                events |= selectors.EVENT_READ
+            if pipe.target is connection and pipe.pending:
+                events |= selectors.EVENT_WRITE
+        return events
+
+    def _client_events(self) -> int:
+        if self.handshaking:
+            return self.handshake_events
+
+        if self.pipes:
+            return self._pipe_events(self.client)
+
+        events = selectors.EVENT_WRITE if self.client.buffer else 0
+        if not self.server or not self.server.buffer.full:
+            events |= selectors.EVENT_READ
+        return events
+
+    def _server_events(self) -> int:
+        if self.connecting:
+            return selectors.EVENT_WRITE
+
+        if self.pipes:
+            return self._pipe_events(self.server)
+
+        events = selectors.EVENT_WRITE if self.server.buffer else 0
+        if not self.client.buffer.full:
+            events |= selectors.EVENT_READ
+        return events
+
+    def _watch(self, connection: Connection, events: int) -> None:
+        sock = connection.conn
+        current = self.__events.get(sock)
+
+        # A full pipe or buffer leaves nothing to wait for here until the other side drains.
+        if not events:
+            if current is not None:
+                self.loop.selector.unregister(sock)
+                del self.__events[sock]
+            return
+
+        if current is None:
+            self.loop.selector.register(sock, events, (self, connection))
+        elif current != events:
+            self.loop.selector.modify(sock, events, (self, connection))
+
+        self.__events[sock] = events
+
+    def _can_splice(self) -> bool:
+        return (
+            not self.pipes
+            and self.server is not None
+            and not self.connecting
+            and not self.handshaking
+            and not self.client.buffer
+            and not self.server.buffer
+            and self.http_parser.is_tunnel
+            and Splice.supports(self.client, self.server)
+        )
+
+    def _relay(self, connection: Connection, mask: int) -> None:
+        for pipe in self.pipes:
+            if pipe.target is connection and mask & selectors.EVENT_WRITE:
+                pipe.drain()
+            if pipe.source is connection and mask & selectors.EVENT_READ:
+                pipe.fill()
+
+        if any(pipe.done for pipe in self.pipes):
+            self.close()
+
+    def update(self) -> None:
+        if self._can_splice():
+            self.pipes = [Splice(self.client, self.server), Splice(self.server, self.client)]
+            logger.debug(f'{self.client} Túnel em modo splice')
+
+        self._watch(self.client, self._client_events())
+
+        if self.server:
+            self._watch(self.server, self._server_events())
+
+    def _receive(self, connection: Connection) -> Optional[bytes]:
+        chunks = []
+
+        while True:
+            try:
+                data = connection.read(65536)
+            except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                break
+
+            if data is None:
+                return None
+
+            chunks.append(data)
+
+            # Decrypted bytes already buffered by the TLS layer never wake up the selector.
+            if not isinstance(connection.conn, ssl.SSLSocket) or not connection.conn.pending():
+                break
+
+        return b''.join(chunks)
+
+    def _flush(self, connection: Connection) -> None:
+        if not connection.buffer:
+            return
+
+        try:
+            sent = connection.flush()
+            logger.debug(f'{connection} enviou {sent} Bytes')
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            pass
+
+    def _handshake(self) -> None:
+        try:
+            self.client.conn.do_handshake()
+            self.handshaking = False
+            self.tls.record(self.client.conn, time.perf_counter() - self.handshake_started)
+        except ssl.SSLWantReadError:
+            self.handshake_events = selectors.EVENT_READ
+        except ssl.SSLWantWriteError:
+            self.handshake_events = selectors.EVENT_WRITE
+
+    def _process_request(self, data: bytes) -> None:
+        self.http_parser.parse(data)
+
+        self.server = Server.of(self.http_parser.remote_address)
+        self.server.connect_nonblocking()
+        self.connecting = True
+
+        if not self.http_parser.is_tunnel:
+            self.server.queue(self.http_parser.build())
+
+        logger.info(f'{self.client} -> Solicitação: {self.http_parser.build()}')
+
+    def _process_client(self, mask: int) -> None:
+        if self.handshaking:
+            self._handshake()
+            return
+
+        if mask & selectors.EVENT_WRITE:
+            self._flush(self.client)
+
+        if mask & selectors.EVENT_READ:
+            data = self._receive(self.client)
+            if data is None:
+                self.close()
+            elif data and self.server:
+                self.server.queue(data)
+                logger.debug(f'{self.client} recebeu {len(data)} Bytes')
+            elif data:
+                self._process_request(data)
+
+    def _process_server(self, mask: int) -> None:
+        if self.connecting:
+            self.server.finish_connect()
+            self.connecting = False
+
+            if self.http_parser.is_tunnel:
+                self.client.queue(DEFAULT_RESPONSE)
+            return
+
+        if mask & selectors.EVENT_WRITE:
+            self._flush(self.server)
+
+        if mask & selectors.EVENT_READ:
+            data = self._receive(self.server)
+            if data is None:
+                self.close()
+            elif data:
+                self.client.queue(data)
+                logger.debug(f'{self.server} recebeu {len(data)} Bytes')
+
+    def process(self, connection: Connection, mask: int) -> None:
+        try:
+            if self.pipes:
+                self._relay(connection, mask)
+            elif connection is self.client:
+                self._process_client(mask)
+            else:
+                self._process_server(mask)
+
+            if not self.closed:
+                self.update()
+        except Exception as e:
+            logger.error(f'{self.client} Erro: {e}')
+            self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        for sock in self.__events:
+            self.loop.selector.unregister(sock)
+
+        for pipe in self.pipes:
+            pipe.close()
+
+        self.client.close()
+        if self.server and not self.server.closed:
+            self.server.close()
+
+        self.loop.tunnels -= 1
+        logger.info(f'{self.client} Desconectado')
+
+
+class EventLoop(threading.Thread):
+    def __init__(self) -> None:
+        super().__init__()
+        self.daemon = True
+
+        self.selector = selectors.DefaultSelector()
+        self.tunnels = 0
+
+        self.__incoming = collections.deque()
+        self.__wakeup, self.__notify = socket.socketpair()
+        self.__wakeup.setblocking(False)
+        self.__notify.setblocking(False)
+        self.selector.register(self.__wakeup, selectors.EVENT_READ)
+
+    def add(self, client: Client, tls: Optional[TLSContext] = None) -> None:
+        self.__incoming.append((client, tls))
+
+        try:
+            self.__notify.send(b'\0')
+        except OSError:
+            pass
+
+    def _accept(self) -> None:
+        try:
+            while self.__wakeup.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while self.__incoming:
+            client, tls = self.__incoming.popleft()
+            client.conn.setblocking(False)
+
+            tunnel = Tunnel(self, client, tls)
+            self.tunnels += 1
+            logger.info(f'{client} Conectado')
+
+            if tls:
+                tunnel.process(client, selectors.EVENT_READ)
+            else:
+                tunnel.update()
+
+    def run(self) -> None:
+        while True:
+            for key, mask in self.selector.select():
+                if key.data is None:
+                    self._accept()
+                    continue
+
+                tunnel, connection = key.data
+                if not tunnel.closed:
+                    tunnel.process(connection, mask)
+
+
+class EventLoopPool:
+    def __init__(self, size: int = 1) -> None:
+        self.loops = [EventLoop() for _ in range(max(size, 1))]
+        self.__next = itertools.cycle(self.loops)
+
+        for loop in self.loops:
+            loop.start()
+
+    def add(self, client: Client, tls: Optional[TLSContext] = None) -> None:
+        next(self.__next).add(client, tls)
+
+
+class AsyncProxy:
+    BUFFER_SIZE = 65536
+    CONNECT_TIMEOUT = 5
+
+    def __init__(
+        self,
+        listeners: List[Tuple[Tuple[str, int], Optional[TLSContext]]],
+        backlog: int = 5,
+    ) -> None:
+        self.listeners = listeners
+        self.backlog = backlog
+
+    async def pipe(
+        self, name: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                data = await reader.read(self.BUFFER_SIZE)
+                if not data:
+                    break
+
+                writer.write(data)
+                # Stop reading this side until the other one has taken the data.
+                await writer.drain()
+                logger.debug(f'{name} recebeu {len(data)} Bytes')
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        tls: Optional[TLSContext] = None,
+    ) -> None:
+        addr = writer.get_extra_info('peername')
+        client = f'Cliente - {addr[0]}:{addr[1]}'
+        logger.info(f'{client} Conectado')
+
+        try:
+            if tls:
+                # The handshake already ran inside the transport, so only resumption is counted.
+                tls.record(writer.get_extra_info('ssl_object'))
+                tls.reload()
+
+            data = await reader.read(self.BUFFER_SIZE)
+            if not data:
+                return
+
+            http_parser = HttpParser()
+            http_parser.parse(data)
+            host, port = http_parser.remote_address
+
+            remote_reader, remote_writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), self.CONNECT_TIMEOUT
+            )
+
+            for stream in (writer, remote_writer):
+                stream.transport.set_write_buffer_limits(
+                    Connection.HIGH_WATERMARK, Connection.LOW_WATERMARK
+                )
+            logger.info(f'Servidor - {host}:{port} Conexão estabelecida')
+
+            if http_parser.is_tunnel:
+                writer.write(DEFAULT_RESPONSE)
+            else:
+                remote_writer.write(http_parser.build())
+
+            logger.info(f'{client} -> Solicitação: {http_parser.build()}')
+
+            await asyncio.gather(
+                self.pipe(client, reader, remote_writer),
+                self.pipe(f'Servidor - {host}:{port}', remote_reader, writer),
+            )
+        except Exception as e:
+            logger.error(f'{client} Erro: {e}')
+        finally:
+            writer.close()
+            logger.info(f'{client} Desconectado')
+
+    async def serve(self) -> None:
+        servers = []
+        for (host, port), tls in self.listeners:
+            server = await asyncio.start_server(
+                functools.partial(self.handle, tls=tls),
+                host,
+                port,
+                ssl=tls.context if tls else None,
+                backlog=self.backlog,
+                reuse_address=True,
+            )
+            servers.append(server)
+            logger.info(f'Servidor iniciado em {host}:{port}')
+
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+    def run(self) -> None:
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            logger.info('Finalizando servidor...')
+
+
 class TCP:
     def __init__(self, addr: Tuple[str, int] = None, backlog: int = 5):
         self.__addr = addr
@@ -319,27 +1055,49 @@ class TCP:
 
 
 class HTTP(TCP):
+    def __init__(
+        self,
+        addr: Tuple[str, int] = None,
+        backlog: int = 5,
+        loops: Optional[EventLoopPool] = None,
+    ) -> None:
+        super().__init__(addr, backlog)
+
+        self.loops = loops
+
     def handle(self, conn: socket.socket, addr: Tuple[str, int]) -> None:
         client = Client(conn, addr)
+        if self.loops:
+            self.loops.add(client)
+            return
+
         proxy = Proxy(client)
         proxy.daemon = True
         proxy.start()
 
 
 class HTTPS(TCP):
-    def __init__(self, addr: Tuple[str, int], cert: str, backlog: int = 5) -> None:
+    def __init__(
+        self,
+        addr: Tuple[str, int],
+        tls: TLSContext,
+        backlog: int = 5,
+        loops: Optional[EventLoopPool] = None,
+    ) -> None:
         super().__init__(addr, backlog)
 
-        self.__cert = cert
+        self.tls = tls
+        self.loops = loops
 
     def handle_thread(self, conn: socket.socket, addr: Tuple[str, int]) -> None:
-        conn = ssl.wrap_socket(
-            sock=conn,
-            keyfile=self.__cert,
-            certfile=self.__cert,
-            server_side=True,
-            ssl_version=ssl.PROTOCOL_TLSv1_2,
-        )
+        try:
+            start = time.perf_counter()
+            conn = self.tls.wrap_socket(conn)
+            self.tls.record(conn, time.perf_counter() - start)
+        except (ssl.SSLError, OSError) as e:
+            logger.error(f'Cliente - {addr[0]}:{addr[1]} Erro no handshake TLS: {e}')
+            conn.close()
+            return
 
         client = Client(conn, addr)
         proxy = Proxy(client)
@@ -347,11 +1105,40 @@ class HTTPS(TCP):
         proxy.start()
 
     def handle(self, conn: socket.socket, addr: Tuple[str, int]) -> None:
+        if self.loops:
+            conn.setblocking(False)
+            conn = self.tls.wrap_socket(conn, handshake=False)
+            self.loops.add(Client(conn, addr), self.tls)
+            return
+
         thread = threading.Thread(target=self.handle_thread, args=(conn, addr))
         thread.daemon = True
         thread.start()
 
 
+def create_ssl_context(cert: str, ciphers: Optional[str] = None) -> ssl.SSLContext:
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.maximum_version = ssl.TLSVersion.MAXIMUM_SUPPORTED
+    context.load_cert_chain(certfile=cert, keyfile=cert)
+
+    if ciphers:
+        context.set_ciphers(ciphers)
+
+    # Stateless tickets (TLS 1.2 and 1.3) plus the server-side cache let reconnects resume.
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = 2
+    return context
+
+
+def raise_open_files_limit() -> None:
+    try:
+        _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError) as e:
+        logger.warning(f'Não foi possível aumentar o limite de arquivos: {e}')
+
+
 def main():
     global REMOTE_ADDRESS
     
@@ -364,10 +1151,47 @@ def main():
         '-r', '--remote', default='%s:%d' % (REMOTE_ADDRESS), help='Remote address, ex: 0.0.0.0:8080'
     )
     parser.add_argument('--cert', default='cert.pem', help='Certificate')
+    parser.add_argument(
+        '--ciphers',
+        help='Cifras TLS 1.2 no formato do OpenSSL, ex: ECDHE+AESGCM:ECDHE+CHACHA20',
+    )
+    parser.add_argument(
+        '--https-port',
+        type=int,
+        default=443,
+        help='Porta HTTPS quando --http e --https são usados juntos',
+    )
 
     parser.add_argument('--http', action='store_true', help='HTTP')
     parser.add_argument('--https', action='store_true', help='HTTPS')
 
+    parser.add_argument(
+        '--engine',
+        choices=['thread', 'epoll', 'asyncio'],
+        default='thread',
+        help='Uma thread por túnel, loops de eventos (epoll) ou asyncio',
+    )
+    parser.add_argument('--loops', type=int, default=1, help='Loops de eventos do engine epoll')
+    parser.add_argument(
+        '--relay',
+        choices=['copy', 'splice'],
+        default='copy',
+        help='Repasse dos túneis sem TLS: copy ou splice (zero-copy, engines thread e epoll)',
+    )
+
+    parser.add_argument(
+        '--high-watermark',
+        type=int,
+        default=Connection.HIGH_WATERMARK,
+        help='Bytes pendentes por lado que pausam a leitura do outro lado',
+    )
+    parser.add_argument(
+        '--low-watermark',
+        type=int,
+        default=Connection.LOW_WATERMARK,
+        help='Bytes pendentes em que a leitura é retomada',
+    )
+
     parser.add_argument('--log', default='INFO', help='Log level')
     parser.add_argument('--usage', action='store_true', help='Usage')
 
@@ -380,22 +1204,54 @@ def main():
     if args.remote:
         REMOTE_ADDRESS = args.remote.split(':')[0], int(args.remote.split(':')[1])
 
-    if args.http:
-        server = HTTP((args.host, args.port), args.backlog)
-    elif args.https:
-        if not os.path.exists(args.cert):
-            raise FileNotFoundError(f'Certicado {args.cert} não encontrado')
-        server = HTTPS((args.host, args.port), args.cert, args.backlog)
-    else:
+    if not args.http and not args.https:
         parser.print_help()
         return
 
+    if args.https and not os.path.exists(args.cert):
+        raise FileNotFoundError(f'Certicado {args.cert} não encontrado')
+
+    http_addr = (args.host, args.port)
+    https_addr = (args.host, args.https_port if args.http else args.port)
+
+    if args.engine != 'thread':
+        raise_open_files_limit()
+
+    if args.relay == 'splice' and not hasattr(os, 'splice'):
+        logger.warning('os.splice indisponível, usando cópia')
+
+    Splice.ENABLED = args.relay == 'splice'
+    Connection.HIGH_WATERMARK = args.high_watermark
+    Connection.LOW_WATERMARK = min(args.low_watermark, args.high_watermark)
+
+    tls = TLSContext(args.cert, args.ciphers) if args.https else None
+
+    if args.engine == 'asyncio':
+        listeners = []
+        if args.http:
+            listeners.append((http_addr, None))
+        if args.https:
+            listeners.append((https_addr, tls))
+
+        servers = [AsyncProxy(listeners, args.backlog)]
+    else:
+        loops = EventLoopPool(args.loops) if args.engine == 'epoll' else None
+
+        servers = []
+        if args.http:
+            servers.append(HTTP(http_addr, args.backlog, loops))
+        if args.https:
+            servers.append(HTTPS(https_addr, tls, args.backlog, loops))
+
     logging.basicConfig(
         level=getattr(logging, args.log.upper()),
         format='[%(asctime)s] %(levelname)s: %(message)s',
     )
 
-    server.run()
+    for server in servers[:-1]:
+        threading.Thread(target=server.run, daemon=True).start()
+
+    servers[-1].run()
 
 
 if __name__ == '__main__':
@@ -1,20 +1,36 @@
 #!/usr/bin/env python3
 
 import typing as t
+import types
+import math
+import array
+import bisect
+import contextlib
 
 import os
 import sys
+import mmap
 import json
+import time
+import struct
+import sqlite3
 
 import socket
 import threading
 import queue
+import asyncio
+import selectors
+import itertools
+import collections
 
+from concurrent.futures import ThreadPoolExecutor
+
+import signal
 import logging
 import argparse
 
-from datetime import datetime
-from urllib.parse import urlparse
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs
 
 __author__ = '@DuTra01'
 __version__ = '2.1.4'
@@ -26,15 +42,458 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+Labels = t.Tuple[t.Tuple[str, str], ...]
 
-class OpenVPNManager:
-    def __init__(self, port: int = 7505):
+
+class Histogram:
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, buckets: t.Sequence[float] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__types = {}
+        self.__help = {}
+        self.__counters = {}
+        self.__histograms = {}
+        self.__callbacks = {}
+
+    def describe(self, name: str, type: str, help: str) -> None:
+        self.__types[name] = type
+        self.__help[name] = help
+
+    def inc(self, name: str, labels: Labels = (), value: float = 1) -> None:
+        with self.__lock:
+            key = (name, labels)
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        with self.__lock:
+            key = (name, labels)
+            if key not in self.__histograms:
+                self.__histograms[key] = Histogram()
+            self.__histograms[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, labels: Labels = ()) -> t.Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def register(
+        self,
+        name: str,
+        function: t.Callable[[], t.Iterable[t.Tuple[Labels, float]]],
+    ) -> None:
+        self.__callbacks[name] = function
+
+    @staticmethod
+    def format_labels(labels: Labels) -> str:
+        if not labels:
+            return ''
+
+        return '{%s}' % ','.join('%s="%s"' % (key, value) for key, value in labels)
+
+    def export(self) -> t.Dict[str, t.List[t.Any]]:
+        with self.__lock:
+            counters = [[name, labels, value] for (name, labels), value in self.__counters.items()]
+            histograms = [
+                [name, labels, list(histogram.counts), histogram.sum]
+                for (name, labels), histogram in self.__histograms.items()
+            ]
+
+        gauges = [
+            [name, labels, value]
+            for name, function in list(self.__callbacks.items())
+            for labels, value in function()
+        ]
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+    def samples(self, peers: t.Sequence[t.Dict[str, t.Any]] = ()) -> t.Dict[str, t.List[str]]:
+        counters = {}
+        histograms = {}
+        gauges = {}
+
+        # Other worker processes send their exports as JSON, so labels come back as lists.
+        for data in [self.export(), *peers]:
+            for name, labels, value in data['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+
+            for name, labels, counts, total in data['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                histogram = histograms.setdefault(key, Histogram())
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+
+            for name, labels, value in data['gauges']:
+                key = tuple(map(tuple, labels))
+                values = gauges.setdefault(name, {})
+                values[key] = values.get(key, 0) + value
+
+        samples = {}
+
+        for (name, labels), value in counters.items():
+            samples.setdefault(name, []).append(
+                '%s%s %s' % (name, self.format_labels(labels), value)
+            )
+
+        for (name, labels), histogram in histograms.items():
+            lines = samples.setdefault(name, [])
+            count = 0
+            for bound, value in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                count += value
+                le = (('le', '+Inf' if bound == float('inf') else repr(bound)),)
+                lines.append('%s_bucket%s %d' % (name, self.format_labels(labels + le), count))
+
+            lines.append('%s_sum%s %r' % (name, self.format_labels(labels), histogram.sum))
+            lines.append('%s_count%s %d' % (name, self.format_labels(labels), count))
+
+        for name, values in gauges.items():
+            samples[name] = [
+                '%s%s %s' % (name, self.format_labels(labels), value)
+                for labels, value in values.items()
+            ]
+
+        return samples
+
+    def render(self, peers: t.Sequence[t.Dict[str, t.Any]] = ()) -> str:
+        lines = []
+
+        for name, samples in sorted(self.samples(peers).items()):
+            if name in self.__help:
+                lines.append('# HELP %s %s' % (name, self.__help[name]))
+                lines.append('# TYPE %s %s' % (name, self.__types[name]))
+            lines.extend(samples)
+
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('checker_requests_total', 'counter', 'Requests handled per command')
+metrics.describe(
+    'checker_request_duration_seconds', 'histogram', 'Request handling time per command'
+)
+metrics.describe('checker_source_duration_seconds', 'histogram', 'Time spent reading each source')
+metrics.describe('checker_snapshot_duration_seconds', 'histogram', 'Time to build a snapshot')
+metrics.describe('checker_errors_total', 'counter', 'Errors per source')
+metrics.describe('checker_queue_depth', 'gauge', 'Connections waiting for a worker')
+metrics.describe('checker_shed_total', 'counter', 'Requests rejected with 503 per reason')
+metrics.describe('checker_singleflight_total', 'counter', 'Single-flight lookups per result')
+metrics.describe('checker_enforce_duration_seconds', 'histogram', 'Time to enforce limits per tick')
+metrics.describe(
+    'checker_enforce_latency_seconds', 'histogram', 'Snapshot age when its enforcement finished'
+)
+metrics.describe('checker_enforce_kills_total', 'counter', 'Sessions killed over the limit')
+metrics.describe('checker_enforce_last_kills', 'gauge', 'Sessions killed on the last tick')
+metrics.describe('checker_history_bytes', 'gauge', 'Memory held by connection history buffers')
+metrics.describe('checker_events_total', 'counter', 'Connection change events published')
+metrics.describe('checker_event_subscribers', 'gauge', 'Event subscribers per mode')
+metrics.describe('checker_event_dropped_total', 'counter', 'Event subscribers dropped as too slow')
+
+
+class OpenVPNSession(t.NamedTuple):
+    common_name: str
+    real_address: str
+    connected_since: t.Optional[float] = None
+    client_id: t.Optional[int] = None
+
+
+class OpenVPNStatusParser:
+    CLIENT_LIST_COLUMNS = [
+        'Common Name',
+        'Real Address',
+        'Bytes Received',
+        'Bytes Sent',
+        'Connected Since',
+    ]
+
+    def __init__(self):
+        self.sessions = {}
+        self.columns = None
+        self.in_client_list = False
+        self.dates = {}
+
+    def parse_date(self, value: str) -> t.Optional[float]:
+        if value not in self.dates:
+            try:
+                date = datetime.strptime(value, '%a %b %d %H:%M:%S %Y')
+                self.dates[value] = date.timestamp()
+            except ValueError:
+                self.dates[value] = None
+
+        return self.dates[value]
+
+    def add_session(self, fields: t.List[str], columns: t.List[str]) -> None:
+        row = dict(zip(columns, fields))
+        common_name = row.get('Common Name', '')
+        username = row.get('Username', '')
+
+        # Without client certificates the CN is UNDEF and only the Username names the user.
+        names = {name for name in (common_name, username) if name and name != 'UNDEF'}
+        if not names:
+            return
+
+        connected_since = None
+        if row.get('Connected Since (time_t)', '').isdigit():
+            connected_since = float(row['Connected Since (time_t)'])
+        elif row.get('Connected Since'):
+            connected_since = self.parse_date(row['Connected Since'])
+
+        client_id = row.get('Client ID', '')
+        session = OpenVPNSession(
+            common_name=common_name,
+            real_address=row.get('Real Address', ''),
+            connected_since=connected_since,
+            client_id=int(client_id) if client_id.isdigit() else None,
+        )
+
+        for name in names:
+            self.sessions.setdefault(name, []).append(session)
+
+    def feed(self, line: str) -> None:
+        line = line.rstrip('\r\n')
+        if not line:
+            return
+
+        fields = line.split('\t') if '\t' in line else line.split(',')
+        tag = fields[0]
+
+        if tag == 'HEADER':
+            if len(fields) > 2 and fields[1] == 'CLIENT_LIST':
+                self.columns = fields[2:]
+            return
+
+        if tag == 'CLIENT_LIST':
+            self.add_session(fields[1:], self.columns or ['Common Name', 'Real Address'])
+            return
+
+        if tag == 'OpenVPN CLIENT LIST':
+            self.in_client_list = True
+            self.columns = self.CLIENT_LIST_COLUMNS
+            return
+
+        if tag in ('ROUTING TABLE', 'GLOBAL STATS', 'END'):
+            self.in_client_list = False
+            return
+
+        if self.in_client_list:
+            if tag == 'Common Name':
+                self.columns = fields
+            elif tag != 'Updated':
+                self.add_session(fields, self.columns)
+
+    @classmethod
+    def parse(cls, lines: t.Iterable[str]) -> t.Dict[str, t.List[OpenVPNSession]]:
+        parser = cls()
+        for line in lines:
+            parser.feed(line)
+        return parser.sessions
+
+
+class OpenVPNStatusLog:
+    HEAD_SIZE = 256
+    LABELS = (('source', 'openvpn_log'),)
+
+    __logs = {}
+    __logs_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self.__lock = threading.Lock()
+        self.__parser = OpenVPNStatusParser()
+        self.__inode = None
+        self.__mtime = None
+        self.__offset = 0
+        self.__head = b''
+        self.__sessions = {}
+
+    @classmethod
+    def shared(cls, path: str) -> 'OpenVPNStatusLog':
+        with cls.__logs_lock:
+            if path not in cls.__logs:
+                cls.__logs[path] = cls(path)
+            return cls.__logs[path]
+
+    def reset(self) -> None:
+        self.__parser = OpenVPNStatusParser()
+        self.__inode = None
+        self.__mtime = None
+        self.__offset = 0
+        self.__head = b''
+        self.__sessions = {}
+
+    def is_appended(self, f: t.BinaryIO, stat: os.stat_result) -> bool:
+        if stat.st_ino != self.__inode or stat.st_size < self.__offset:
+            return False
+
+        f.seek(0)
+        return f.read(len(self.__head)) == self.__head
+
+    def read(self) -> None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            self.reset()
+            return
+
+        if stat.st_ino == self.__inode and stat.st_mtime_ns == self.__mtime:
+            if stat.st_size == self.__offset:
+                return
+
+        with open(self.path, 'rb') as f:
+            if not self.is_appended(f, stat):
+                self.reset()
+                self.__inode = stat.st_ino
+                self.__head = f.read(self.HEAD_SIZE)
+
+            f.seek(self.__offset)
+            data = f.read()
+
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].decode('utf-8', 'replace').splitlines():
+            self.__parser.feed(line)
+
+        self.__offset += end
+        self.__mtime = stat.st_mtime_ns
+        self.__sessions = {name: list(items) for name, items in self.__parser.sessions.items()}
+
+    def get_sessions(self) -> t.Dict[str, t.List[OpenVPNSession]]:
+        with self.__lock, metrics.timer('checker_source_duration_seconds', self.LABELS):
+            self.read()
+            return self.__sessions
+
+
+class OpenVPNManagementClient:
+    LABELS = (('source', 'openvpn_manager'),)
+
+    persistent = True
+
+    __clients = {}
+    __clients_lock = threading.Lock()
+
+    def __init__(self, host: str = 'localhost', port: int = 7505, ttl: float = 1.0):
+        self.host = host
         self.port = port
-        self.config_path = '/etc/openvpn/'
+        self.ttl = ttl
+        self.timeout = 5.0
+
+        self.__sock = None
+        self.__file = None
+        self.__lock = threading.RLock()
+
+        self.__sessions = None
+        self.__updated_at = 0.0
+
+    @classmethod
+    def shared(cls, host: str = 'localhost', port: int = 7505) -> 'OpenVPNManagementClient':
+        with cls.__clients_lock:
+            if (host, port) not in cls.__clients:
+                cls.__clients[(host, port)] = cls(host, port)
+            return cls.__clients[(host, port)]
+
+    def connect(self) -> None:
+        self.close()
+        self.__sock = socket.create_connection((self.host, self.port), self.timeout)
+        self.__file = self.__sock.makefile('rb')
+
+    def close(self) -> None:
+        if self.__file:
+            self.__file.close()
+        if self.__sock:
+            self.__sock.close()
+
+        self.__sock = None
+        self.__file = None
+
+    def read_line(self) -> str:
+        while True:
+            line = self.__file.readline()
+            if not line:
+                raise ConnectionError('Management interface closed the connection')
+
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+            if not line.startswith('>'):
+                return line
+
+    def send_command(self, command: str, multiline: bool = False) -> t.List[str]:
+        with self.__lock:
+            for attempt in range(2):
+                try:
+                    if self.__sock is None:
+                        self.connect()
+
+                    self.__sock.sendall(command.encode() + b'\n')
+                    lines = self.read_response(multiline)
+
+                    if not self.persistent:
+                        self.close()
+
+                    return lines
+                except OSError:
+                    self.close()
+                    if attempt > 0:
+                        raise
+
+    def read_response(self, multiline: bool) -> t.List[str]:
+        if not multiline:
+            return [self.read_line()]
+
+        lines = []
+        line = self.read_line()
+        while line != 'END':
+            lines.append(line)
+            line = self.read_line()
+
+        return lines
+
+    def get_sessions(self) -> t.Dict[str, t.List[OpenVPNSession]]:
+        with self.__lock:
+            now = time.monotonic()
+            if self.__sessions is None or now - self.__updated_at > self.ttl:
+                with metrics.timer('checker_source_duration_seconds', self.LABELS):
+                    lines = self.send_command('status 2', True)
+                    self.__sessions = OpenVPNStatusParser.parse(lines)
+                self.__updated_at = now
+
+            return self.__sessions
+
+    def kill(self, target: str) -> bool:
+        with self.__lock:
+            self.__sessions = None
+            return self.send_command('kill %s' % target)[0].startswith('SUCCESS')
+
+    def kill_client(self, client_id: int) -> bool:
+        with self.__lock:
+            self.__sessions = None
+            return self.send_command('client-kill %s' % client_id)[0].startswith('SUCCESS')
+
+
+class OpenVPNManager:
+    PORT = 7505
+    CONFIG_PATH = '/etc/openvpn/'
+    LOG_PATH = '/var/log/openvpn/'
+
+    def __init__(self, port: t.Optional[int] = None):
+        self.port = port or self.PORT
+        self.config_path = self.CONFIG_PATH
         self.config_file = 'server.conf'
         self.log_file = 'openvpn.log'
-        self.log_path = '/var/log/openvpn/'
+        self.log_path = self.LOG_PATH
 
+        self.management = OpenVPNManagementClient.shared('localhost', self.port)
         self.start_manager()
 
     @property
@@ -47,13 +506,7 @@ class OpenVPNManager:
         if os.path.exists(path):
             return path
 
-        self.log_path = 'openvpn-status.log'
-        return os.path.join(self.config_path, self.log_file)
-
-    def create_connection(self) -> socket.socket:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect(('localhost', self.port))
-        return sock
+        return os.path.join(self.config_path, 'openvpn-status.log')
 
     def start_manager(self) -> None:
         if os.path.exists(self.config):
@@ -71,81 +524,608 @@ class OpenVPNManager:
 
             os.system('service openvpn restart')
 
-    def count_connection_from_manager(self, username: str) -> int:
+    def get_sessions_from_manager(self) -> t.Optional[t.Dict[str, t.List[OpenVPNSession]]]:
         try:
-            soc = self.create_connection()
-            soc.send(b'status\n')
+            return self.management.get_sessions()
+        except Exception:
+            metrics.inc('checker_errors_total', OpenVPNManagementClient.LABELS)
+            return None
 
-            data = b''
-            buf = data
+    def get_sessions_from_log(self) -> t.Dict[str, t.List[OpenVPNSession]]:
+        return OpenVPNStatusLog.shared(self.log).get_sessions()
 
-            while b'\r\nEND\r\n' not in buf:
-                buf = soc.recv(1024)
-                data += buf
+    def get_sessions(self) -> t.Dict[str, t.List[OpenVPNSession]]:
+        sessions = self.get_sessions_from_manager()
+        return sessions if sessions is not None else self.get_sessions_from_log()
 
-            soc.close()
-            count = data.count(username.encode())
-            return count // 2 if count > 0 else 0
-        except Exception:
+    def count_connection_from_manager(self, username: str) -> int:
+        sessions = self.get_sessions_from_manager()
+        if sessions is None:
             return -1
 
+        return len(sessions.get(username, []))
+
     def count_connection_from_log(self, username: str) -> int:
-        if os.path.exists(self.log):
-            with open(self.log, 'r') as f:
-                data = f.read()
-                count = data.count(username)
-                return count // 2 if count > 0 else 0
-        return 0
+        return len(self.get_sessions_from_log().get(username, []))
 
     def count_connections(self, username: str) -> int:
-        count = self.count_connection_from_manager(username)
-        return count if count > -1 else self.count_connection_from_log(username)
+        return len(self.get_sessions().get(username, []))
+
+    def count_all_connections(self, usernames: t.Iterable[str]) -> t.Dict[str, int]:
+        sessions = self.get_sessions()
+        return {username: len(sessions.get(username, [])) for username in usernames}
 
     def kill_connection(self, username: str) -> None:
-        soc = self.create_connection()
-        soc.send(b'kill %s\n' % username.encode())
-        soc.close()
+        self.management.kill(username)
+
+    def kill_session(self, session: OpenVPNSession) -> bool:
+        if session.client_id is not None:
+            return self.management.kill_client(session.client_id)
+
+        return self.management.kill(session.real_address)
+
+
+class ProcessSession(t.NamedTuple):
+    pid: int
+    uid: int
+    started_at: float
+
+
+class ProcessIndex:
+    PATH = '/proc'
+
+    __indexes = {}
+    __indexes_lock = threading.Lock()
+
+    def __init__(
+        self,
+        proc_path: t.Optional[str] = None,
+        process_name: str = 'sshd',
+        max_age: float = 1.0,
+    ):
+        self.proc_path = proc_path or self.PATH
+        self.process_name = process_name
+        self.max_age = max_age
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+
+        self.__boot_time = None
+        self.__sessions = {}
+        self.__updated_at = 0.0
+        self.__lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, proc_path: t.Optional[str] = None) -> 'ProcessIndex':
+        key = (cls, proc_path or cls.PATH)
+
+        with cls.__indexes_lock:
+            if key not in cls.__indexes:
+                cls.__indexes[key] = cls(proc_path)
+            return cls.__indexes[key]
+
+    @property
+    def boot_time(self) -> float:
+        if self.__boot_time is None:
+            with open(os.path.join(self.proc_path, 'stat')) as f:
+                for line in f:
+                    if line.startswith('btime '):
+                        self.__boot_time = float(line.split()[1])
+                        break
+                else:
+                    self.__boot_time = 0.0
+
+        return self.__boot_time
+
+    def read_process(self, pid: str) -> t.Optional[ProcessSession]:
+        path = os.path.join(self.proc_path, pid)
+
+        try:
+            with open(os.path.join(path, 'stat'), 'rb') as f:
+                stat = f.read()
+
+            end = stat.rfind(b')')
+            comm = stat[stat.find(b'(') + 1 : end].decode('utf-8', 'replace')
+            if self.process_name not in comm:
+                return None
+
+            with open(os.path.join(path, 'status'), 'rb') as f:
+                for line in f:
+                    if line.startswith(b'Uid:'):
+                        uid = int(line.split()[2])
+                        break
+                else:
+                    return None
+
+            # Field 22 (starttime) is the 20th field after the command name.
+            start_ticks = int(stat[end + 2 :].split()[19])
+        except (OSError, ValueError, IndexError):
+            return None
+
+        started_at = self.boot_time + start_ticks / self.clock_ticks
+        return ProcessSession(int(pid), uid, started_at)
+
+    def scan(self) -> t.Dict[int, t.List[ProcessSession]]:
+        sessions = {}
+
+        for pid in os.listdir(self.proc_path):
+            if not pid.isdigit():
+                continue
+
+            session = self.read_process(pid)
+            if session is not None:
+                sessions.setdefault(session.uid, []).append(session)
+
+        for items in sessions.values():
+            items.sort(key=lambda session: session.pid)
+
+        return sessions
+
+    def refresh(self, force: bool = False) -> t.Dict[int, t.List[ProcessSession]]:
+        with self.__lock:
+            now = time.monotonic()
+            if force or now - self.__updated_at > self.max_age:
+                with metrics.timer('checker_source_duration_seconds', (('source', 'ssh'),)):
+                    self.__sessions = self.scan()
+                self.__updated_at = time.monotonic()
+
+            return self.__sessions
+
+    def sessions(self, uid: int) -> t.List[ProcessSession]:
+        return self.refresh().get(uid, [])
+
+
+class SocketIndex(ProcessIndex):
+    PORTS: t.Tuple[int, ...] = ()
+    PROCESS_NAMES = ('sshd', 'dropbear')
+
+    NETLINK_SOCK_DIAG = 4
+    SOCK_DIAG_BY_FAMILY = 20
+    NLM_F_REQUEST = 0x1
+    NLM_F_DUMP = 0x300
+    NLMSG_ERROR = 2
+    NLMSG_DONE = 3
+    TCP_ESTABLISHED = 1
+    TCP_LISTEN = 10
+
+    NLMSGHDR = struct.Struct('=IHHII')
+    # inet_diag_req_v2 with an empty inet_diag_sockid, so the dump matches every socket.
+    REQUEST = struct.Struct('=BBBBI48x')
+    # inet_diag_msg: state, source port (big endian), uid and inode.
+    MESSAGE = struct.Struct('=xBxx2s46x12xII')
+
+    def __init__(
+        self,
+        proc_path: t.Optional[str] = None,
+        ports: t.Optional[t.Iterable[int]] = None,
+        max_age: float = 1.0,
+    ):
+        super(SocketIndex, self).__init__(proc_path, max_age=max_age)
+        self.ports = tuple(ports) if ports is not None else self.PORTS
+
+    def receive(self, sock: socket.socket) -> t.Iterator[t.Tuple[int, int, int]]:
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return
+
+            offset = 0
+            while offset + self.NLMSGHDR.size <= len(data):
+                length, kind = self.NLMSGHDR.unpack_from(data, offset)[:2]
+                if kind == self.NLMSG_DONE or length < self.NLMSGHDR.size:
+                    return
+
+                if kind == self.NLMSG_ERROR:
+                    error = -struct.unpack_from('=i', data, offset + self.NLMSGHDR.size)[0]
+                    raise OSError(error, os.strerror(error))
+
+                state, port, _, inode = self.MESSAGE.unpack_from(data, offset + self.NLMSGHDR.size)
+                yield state, int.from_bytes(port, 'big'), inode
+                offset += (length + 3) & ~3
+
+    def dump(self) -> t.List[t.Tuple[int, int, int]]:
+        sockets = []
+        states = 1 << self.TCP_ESTABLISHED | 1 << self.TCP_LISTEN
+        flags = self.NLM_F_REQUEST | self.NLM_F_DUMP
+
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_SOCK_DIAG) as sock:
+            for seq, family in enumerate((socket.AF_INET, socket.AF_INET6), start=1):
+                request = self.REQUEST.pack(family, socket.IPPROTO_TCP, 0, 0, states)
+                length = self.NLMSGHDR.size + len(request)
+                header = self.NLMSGHDR.pack(length, self.SOCK_DIAG_BY_FAMILY, flags, seq, 0)
+                sock.send(header + request)
+                sockets.extend(self.receive(sock))
+
+        return sockets
+
+    def read_stat(self, pid: str) -> t.Optional[t.Tuple[str, int, int]]:
+        try:
+            with open(os.path.join(self.proc_path, pid, 'stat'), 'rb') as f:
+                stat = f.read()
+
+            end = stat.rfind(b')')
+            comm = stat[stat.find(b'(') + 1 : end].decode('utf-8', 'replace')
+            fields = stat[end + 2 :].split()
+            return comm, int(fields[1]), int(fields[19])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def read_uid(self, pid: int) -> t.Optional[int]:
+        try:
+            with open(os.path.join(self.proc_path, str(pid), 'status'), 'rb') as f:
+                for line in f:
+                    if line.startswith(b'Uid:'):
+                        return int(line.split()[2])
+        except (OSError, ValueError, IndexError):
+            pass
+
+        return None
+
+    def read_sockets(self, pid: str) -> t.Iterator[int]:
+        path = os.path.join(self.proc_path, pid, 'fd')
+
+        try:
+            for fd in os.listdir(path):
+                try:
+                    link = os.readlink(os.path.join(path, fd))
+                except OSError:
+                    continue
+
+                if link.startswith('socket:['):
+                    yield int(link[8:-1])
+        except OSError:
+            return
+
+    def find_owner(
+        self,
+        pids: t.List[int],
+        children: t.Dict[int, t.List[int]],
+        uids: t.Dict[int, t.Optional[int]],
+    ) -> t.Optional[int]:
+        # The socket may only be held by root (dropbear, the privsep monitor), so the user
+        # is the first non-system uid among the holders and then their descendants.
+        pending = collections.deque(sorted(pids))
+        seen = set()
+
+        while pending:
+            pid = pending.popleft()
+            if pid in seen:
+                continue
+
+            seen.add(pid)
+            if pid not in uids:
+                uids[pid] = self.read_uid(pid)
+
+            uid = uids[pid]
+            if uid is not None and 1000 <= uid < 65534:
+                return uid
+
+            pending.extend(children.get(pid, []))
+
+        return None
+
+    def scan(self) -> t.Dict[int, t.List[ProcessSession]]:
+        try:
+            sockets = self.dump()
+        except OSError as e:
+            logger.error('Sock diag error: %s' % e)
+            metrics.inc('checker_errors_total', (('source', 'ssh'),))
+            return super(SocketIndex, self).scan()
+
+        listening = {inode: port for state, port, inode in sockets if state == self.TCP_LISTEN}
+        established = {
+            inode: port for state, port, inode in sockets if state == self.TCP_ESTABLISHED
+        }
+
+        ports = set(self.ports)
+        processes = {}
+        children = {}
+        holders = {}
+
+        for name in os.listdir(self.proc_path):
+            if not name.isdigit():
+                continue
+
+            stat = self.read_stat(name)
+            if stat is None:
+                continue
+
+            pid = int(name)
+            processes[pid] = stat
+            children.setdefault(stat[1], []).append(pid)
+
+            if not any(process_name in stat[0] for process_name in self.PROCESS_NAMES):
+                continue
+
+            for inode in self.read_sockets(name):
+                if inode in established:
+                    holders.setdefault(inode, []).append(pid)
+                elif inode in listening and not self.ports:
+                    ports.add(listening[inode])
+
+        sessions = {}
+        uids = {}
+
+        for inode, pids in holders.items():
+            if established[inode] not in ports:
+                continue
+
+            uid = self.find_owner(pids, children, uids)
+            if uid is None:
+                continue
+
+            pid = min(pids)
+            started_at = self.boot_time + processes[pid][2] / self.clock_ticks
+            sessions.setdefault(uid, []).append(ProcessSession(pid, uid, started_at))
+
+        for items in sessions.values():
+            items.sort(key=lambda session: session.pid)
+
+        return sessions
+
+
+def format_elapsed(seconds: float) -> str:
+    seconds = max(int(seconds), 0)
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+
+    if days:
+        return '%d-%02d:%02d:%02d' % (days, hours, minutes, seconds)
+
+    if hours:
+        return '%02d:%02d:%02d' % (hours, minutes, seconds)
+
+    return '%02d:%02d' % (minutes, seconds)
 
 
 class SSHManager:
+    INDEX: t.Type[ProcessIndex] = ProcessIndex
+
+    def __init__(self, process_index: t.Optional[ProcessIndex] = None):
+        self.process_index = process_index or self.INDEX.shared()
+
+    def get_sessions(self, username: str) -> t.List[ProcessSession]:
+        uid = get_uid(username)
+        return self.process_index.sessions(uid) if uid is not None else []
+
     def count_connections(self, username: str) -> int:
-        command = 'ps -u %s' % username
-        result = os.popen(command).readlines()
-        return len([line for line in result if 'sshd' in line])
+        return len(self.get_sessions(username))
 
     def get_pids(self, username: str) -> t.List[int]:
-        command = 'ps -u %s' % username
-        result = os.popen(command).readlines()
-        return [int(line.split()[0]) for line in result if 'sshd' in line]
+        return [session.pid for session in self.get_sessions(username)]
+
+    def get_time_online(self, username: str) -> t.Optional[str]:
+        sessions = self.get_sessions(username)
+        if not sessions:
+            return None
+
+        started_at = min(session.started_at for session in sessions)
+        return format_elapsed(time.time() - started_at)
 
     def kill_connection(self, username: str) -> None:
-        pids = self.get_pids(username)
-        for pid in pids:
-            os.kill(pid, 9)
+        for session in self.get_sessions(username):
+            self.kill_session(session)
 
+    def kill_session(self, session: ProcessSession) -> bool:
+        os.kill(session.pid, 9)
+        return True
 
-class CheckerUserManager:
-    def __init__(self, username: str):
-        self.username = username
-        self.ssh_manager = SSHManager()
-        self.openvpn_manager = OpenVPNManager()
 
-    def get_expiration_date(self) -> t.Optional[str]:
-        command = 'chage -l %s' % self.username
-        result = os.popen(command).readlines()
+class FileIndex:
+    PATH = None
+    SOURCE = 'file'
 
-        for line in result:
-            line = list(map(str.strip, line.split(':')))
-            if line[0].lower() == 'account expires' and line[1] != 'never':
-                return datetime.strptime(line[1], '%b %d, %Y').strftime('%d/%m/%Y')
+    __indexes = {}
+    __indexes_lock = threading.Lock()
 
-        return None
+    def __init__(self, path: t.Optional[str] = None):
+        self.path = path or self.PATH
+
+        self.__lock = threading.Lock()
+        self.__key = None
+        self.__data = {}
+
+    @classmethod
+    def shared(cls, path: t.Optional[str] = None) -> 'FileIndex':
+        key = (cls, path or cls.PATH)
 
-    def get_expiration_days(self, date: str) -> int:
-        if not isinstance(date, str) or date.lower() == 'never' or not isinstance(date, str):
+        with cls.__indexes_lock:
+            if key not in cls.__indexes:
+                cls.__indexes[key] = cls(path)
+            return cls.__indexes[key]
+
+    def load(self) -> dict:
+        raise NotImplementedError()
+
+    @staticmethod
+    def stat_key(path: str) -> t.Optional[t.Tuple[int, int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    @property
+    def data(self) -> dict:
+        key = self.stat_key(self.path)
+
+        with self.__lock:
+            if key != self.__key:
+                labels = (('source', self.SOURCE),)
+                try:
+                    with metrics.timer('checker_source_duration_seconds', labels):
+                        self.__data = self.load() if key else {}
+                except (OSError, ValueError, sqlite3.Error) as e:
+                    logger.error('Failed to load %s: %s' % (self.path, e))
+                    metrics.inc('checker_errors_total', labels)
+                    self.__data = {}
+
+                self.__key = key
+
+            return self.__data
+
+
+class ShadowExpirationIndex(FileIndex):
+    PATH = '/etc/shadow'
+    SOURCE = 'expiration'
+    EPOCH = datetime(1970, 1, 1)
+
+    def load(self) -> t.Dict[str, int]:
+        expirations = {}
+
+        with open(self.path) as f:
+            for line in f:
+                split = line.rstrip('\n').split(':')
+                if len(split) >= 8 and split[7].isdigit():
+                    expirations[split[0]] = int(split[7])
+
+        return expirations
+
+    @classmethod
+    def today(cls) -> float:
+        return (datetime.now() - cls.EPOCH).total_seconds() / 86400
+
+    def get_expiration_date(self, username: str) -> t.Optional[str]:
+        days = self.data.get(username)
+        if days is None:
+            return None
+
+        return (self.EPOCH + timedelta(days=days)).strftime('%d/%m/%Y')
+
+    def get_expiration_days(self, username: str, today: t.Optional[float] = None) -> int:
+        days = self.data.get(username)
+        if days is None:
             return -1
 
-        return (datetime.strptime(date, '%d/%m/%Y') - datetime.now()).days
+        return math.floor(days - (today if today is not None else self.today()))
+
+
+class PasswdIndex(FileIndex):
+    PATH = '/etc/passwd'
+    SOURCE = 'passwd'
+
+    def load(self) -> t.Dict[str, int]:
+        uids = {}
+
+        with open(self.path) as f:
+            for line in f:
+                split = line.strip().split(':')
+                if len(split) >= 3 and split[2].isdigit():
+                    uids.setdefault(split[0], int(split[2]))
+
+        return uids
+
+    @property
+    def users(self) -> t.List[str]:
+        return [username for username, uid in self.data.items() if 1000 <= uid < 65534]
+
+    def get_uid(self, username: str) -> t.Optional[int]:
+        return self.data.get(username)
+
+
+def get_uid(username: str) -> t.Optional[int]:
+    return PasswdIndex.shared().get_uid(username)
+
+
+class ConnectionLimitIndex(FileIndex):
+    PATH = '/root/usuarios.db'
+    SOURCE = 'limiter'
+
+    __formats = {}
+
+    @classmethod
+    def of(cls, path: t.Optional[str] = None) -> 'ConnectionLimitIndex':
+        path = path or cls.PATH
+        key = cls.stat_key(path)
+
+        # The header is only read again when the file changes.
+        cached = cls.__formats.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        try:
+            with open(path, 'rb') as f:
+                is_sqlite = f.read(16) == SQLiteConnectionLimitIndex.MAGIC
+        except OSError:
+            is_sqlite = False
+
+        index = (SQLiteConnectionLimitIndex if is_sqlite else ConnectionLimitIndex).shared(path)
+        cls.__formats[path] = (key, index)
+        return index
+
+    def load(self) -> t.Dict[str, int]:
+        limits = {}
+
+        with open(self.path) as f:
+            for line in f:
+                split = line.strip().split()
+                if len(split) == 2 and split[1].isdigit() and split[0] not in limits:
+                    limits[split[0]] = int(split[1])
+
+        return limits
+
+    def get_limit(self, username: str) -> int:
+        return self.data.get(username, -1)
+
+
+class SQLiteConnectionLimitIndex(ConnectionLimitIndex):
+    MAGIC = b'SQLite format 3\x00'
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect('file:%s?mode=ro' % self.path, uri=True)
+
+    def load(self) -> t.Dict[str, int]:
+        with contextlib.closing(self.connect()) as conn:
+            return dict(conn.execute('SELECT username, connections FROM limits'))
+
+    @staticmethod
+    def convert(source: str, target: str) -> int:
+        limits = ConnectionLimitIndex(source).load()
+        temp = target + '.tmp'
+
+        if os.path.exists(temp):
+            os.remove(temp)
+
+        with contextlib.closing(sqlite3.connect(temp)) as conn:
+            conn.execute(
+                'CREATE TABLE limits (username TEXT PRIMARY KEY, connections INTEGER NOT NULL)'
+                ' WITHOUT ROWID'
+            )
+            conn.executemany('INSERT INTO limits VALUES (?, ?)', limits.items())
+            conn.commit()
+
+        os.replace(temp, target)
+        return len(limits)
+
+
+class CheckerUserManager:
+    def __init__(
+        self,
+        username: str,
+        ssh_manager: t.Optional[SSHManager] = None,
+        openvpn_manager: t.Optional[OpenVPNManager] = None,
+    ):
+        self.username = username
+        self.__ssh_manager = ssh_manager
+        self.__openvpn_manager = openvpn_manager
+
+    @property
+    def ssh_manager(self) -> SSHManager:
+        if self.__ssh_manager is None:
+            self.__ssh_manager = SSHManager()
+        return self.__ssh_manager
+
+    @property
+    def openvpn_manager(self) -> OpenVPNManager:
+        if self.__openvpn_manager is None:
+            self.__openvpn_manager = OpenVPNManager()
+        return self.__openvpn_manager
+
+    def get_expiration_date(self) -> t.Optional[str]:
+        return ShadowExpirationIndex.shared().get_expiration_date(self.username)
+
+    def get_expiration_days(self) -> int:
+        return ShadowExpirationIndex.shared().get_expiration_days(self.username)
 
     def get_connections(self) -> int:
         return self.ssh_manager.count_connections(
@@ -153,21 +1133,10 @@ class CheckerUserManager:
         ) + self.openvpn_manager.count_connections(self.username)
 
     def get_time_online(self) -> t.Optional[str]:
-        command = 'ps -u %s -o etime --no-headers' % self.username
-        result = os.popen(command).readlines()
-        return result[0].strip() if result else None
+        return self.ssh_manager.get_time_online(self.username)
 
     def get_limiter_connection(self) -> int:
-        path = '/root/usuarios.db'
-
-        if os.path.exists(path):
-            with open(path) as f:
-                for line in f:
-                    split = line.strip().split()
-                    if len(split) == 2 and split[0] == self.username:
-                        return int(split[1].strip())
-
-        return -1
+        return ConnectionLimitIndex.of().get_limit(self.username)
 
     def kill_connection(self) -> None:
         self.ssh_manager.kill_connection(self.username)
@@ -192,41 +1161,171 @@ class CheckerUserConfig:
         except PermissionError:
             path = os.path.join(self.PATH_CONFIG_OPTIONAL, self.CONFIG_FILE)
 
-            if not os.path.exists(path):
-                os.makedirs(self.PATH_CONFIG_OPTIONAL, exist_ok=True)
+            if not os.path.exists(path):
+                os.makedirs(self.PATH_CONFIG_OPTIONAL, exist_ok=True)
+
+        return path
+
+    @property
+    def exclude(self) -> t.List[str]:
+        return self.config.get('exclude', [])
+
+    @exclude.setter
+    def exclude(self, value: t.List[str]):
+        self.config['exclude'] = value
+        self.save_config()
+
+    def include(self, name: str) -> bool:
+        if name in self.exclude:
+            self.exclude.remove(name)
+            self.save_config()
+            return True
+
+        return False
+
+    @property
+    def port(self) -> int:
+        return self.config.get('port', 5000)
+
+    @port.setter
+    def port(self, value: int):
+        self.config['port'] = value
+        self.save_config()
+
+    @property
+    def interval(self) -> float:
+        return self.config.get('interval', 2.0)
+
+    @interval.setter
+    def interval(self, value: float):
+        self.config['interval'] = value
+        self.save_config()
+
+    @property
+    def backlog(self) -> int:
+        return self.config.get('backlog', 128)
+
+    @backlog.setter
+    def backlog(self, value: int):
+        self.config['backlog'] = value
+        self.save_config()
+
+    @property
+    def max_queue(self) -> int:
+        return self.config.get('max_queue', 256)
+
+    @max_queue.setter
+    def max_queue(self, value: int):
+        self.config['max_queue'] = value
+        self.save_config()
+
+    @property
+    def deadline(self) -> float:
+        return self.config.get('deadline', 5.0)
+
+    @deadline.setter
+    def deadline(self, value: float):
+        self.config['deadline'] = value
+        self.save_config()
+
+    @property
+    def processes(self) -> int:
+        return self.config.get('processes', 1)
+
+    @processes.setter
+    def processes(self, value: int):
+        self.config['processes'] = value
+        self.save_config()
+
+    @property
+    def result_ttl(self) -> float:
+        return self.config.get('result_ttl', 1.0)
+
+    @result_ttl.setter
+    def result_ttl(self, value: float):
+        self.config['result_ttl'] = value
+        self.save_config()
+
+    @property
+    def engine(self) -> str:
+        return self.config.get('engine', 'thread')
+
+    @engine.setter
+    def engine(self, value: str):
+        self.config['engine'] = value
+        self.save_config()
+
+    @property
+    def enforce(self) -> float:
+        return self.config.get('enforce', 0.0)
+
+    @enforce.setter
+    def enforce(self, value: float):
+        self.config['enforce'] = value
+        self.save_config()
+
+    @property
+    def history(self) -> int:
+        return self.config.get('history', 1800)
+
+    @history.setter
+    def history(self, value: int):
+        self.config['history'] = value
+        self.save_config()
+
+    @property
+    def persist(self) -> float:
+        return self.config.get('persist', 30.0)
 
-        return path
+    @persist.setter
+    def persist(self, value: float):
+        self.config['persist'] = value
+        self.save_config()
 
     @property
-    def exclude(self) -> t.List[str]:
-        return self.config.get('exclude', [])
+    def ssh_collector(self) -> str:
+        return self.config.get('ssh_collector', 'proc')
 
-    @exclude.setter
-    def exclude(self, value: t.List[str]):
-        self.config['exclude'] = value
+    @ssh_collector.setter
+    def ssh_collector(self, value: str):
+        self.config['ssh_collector'] = value
         self.save_config()
 
-    def include(self, name: str) -> bool:
-        if name in self.exclude:
-            self.exclude.remove(name)
-            self.save_config()
-            return True
+    @property
+    def ssh_ports(self) -> t.List[int]:
+        return self.config.get('ssh_ports', [])
 
-        return False
+    @ssh_ports.setter
+    def ssh_ports(self, value: t.List[int]):
+        self.config['ssh_ports'] = value
+        self.save_config()
 
     @property
-    def port(self) -> int:
-        return self.config.get('port', 5000)
+    def limiter_path(self) -> str:
+        return self.config.get('limiter_path', ConnectionLimitIndex.PATH)
 
-    @port.setter
-    def port(self, value: int):
-        self.config['port'] = value
+    @limiter_path.setter
+    def limiter_path(self, value: str):
+        self.config['limiter_path'] = value
         self.save_config()
 
     def load_config(self) -> dict:
         default_config = {
             'exclude': [],
             'port': 5000,
+            'interval': 2.0,
+            'engine': 'thread',
+            'result_ttl': 1.0,
+            'processes': 1,
+            'backlog': 128,
+            'max_queue': 256,
+            'deadline': 5.0,
+            'limiter_path': ConnectionLimitIndex.PATH,
+            'enforce': 0.0,
+            'history': 1800,
+            'persist': 30.0,
+            'ssh_collector': 'proc',
+            'ssh_ports': [],
         }
 
         if os.path.exists(self.path_config):
@@ -307,6 +1406,7 @@ class ServiceManager:
                 'Type=simple\n',
                 'ExecStart=%s %s --run\n' % (sys.executable, os.path.abspath(__file__)),
                 'Restart=always\n',
+                'KillMode=mixed\n',
                 'User=root\n',
                 'Group=root\n\n',
                 '[Install]\n',
@@ -368,173 +1468,1562 @@ class CheckerManager:
         except Exception as e:
             logger.error(e)
 
-    @staticmethod
-    def get_data() -> str:
-        import requests
+    @staticmethod
+    def get_data() -> str:
+        import requests
+
+        response = requests.get(CheckerManager.RAW_URL_DATA)
+        return response.text
+
+    @staticmethod
+    def check_update() -> t.Union[bool, str]:
+        data = CheckerManager.get_data()
+
+        if data:
+            version = data.split('__version__ = ')[1].split('\n')[0].strip('\'')
+            return version != __version__, version
+
+        return False, __version__
+
+    @staticmethod
+    def update() -> bool:
+        success, version = CheckerManager.check_update()
+        if not success:
+            logger.info('No update available')
+            return False
+
+        logger.info('New version available: %s' % version)
+
+        data = CheckerManager.get_data()
+        if not data:
+            return False
+
+        with open(__file__, 'w') as f:
+            f.write(data)
+
+        CheckerManager.create_executable()
+        ServiceManager().restart()
+        return True
+
+    @staticmethod
+    def remove_executable() -> None:
+        os.remove(CheckerManager.EXECUTABLE_FILE)
+
+
+USER_FIELDS = (
+    'count_connection',
+    'limit_connection',
+    'expiration_date',
+    'expiration_days',
+    'time_online',
+)
+
+
+def select_fields(
+    fields: t.Optional[t.Iterable[str]] = None,
+    exclude: t.Iterable[str] = (),
+) -> t.Tuple[str, ...]:
+    fields = set(fields) if fields else set(USER_FIELDS)
+    exclude = set(exclude)
+    return tuple(name for name in USER_FIELDS if name in fields and name not in exclude)
+
+
+def check_user(username: str, fields: t.Sequence[str] = USER_FIELDS) -> t.Dict[str, t.Any]:
+    try:
+        checker = CheckerUserManager(username)
+        getters = {
+            'count_connection': checker.get_connections,
+            'limit_connection': checker.get_limiter_connection,
+            'expiration_date': checker.get_expiration_date,
+            'expiration_days': checker.get_expiration_days,
+            'time_online': checker.get_time_online,
+        }
+
+        result = {'username': username}
+        result.update((name, getters[name]()) for name in fields)
+        result['version'] = __version__
+        return result
+    except Exception as e:
+        metrics.inc('checker_errors_total', (('source', 'check'),))
+        return {'error': str(e)}
+
+
+def kill_user(username: str) -> dict:
+    result = {
+        'success': True,
+        'error': None,
+    }
+
+    try:
+        checker = CheckerUserManager(username)
+        checker.kill_connection()
+        return result
+    except Exception as e:
+        metrics.inc('checker_errors_total', (('source', 'kill'),))
+        result['success'] = False
+        result['error'] = str(e)
+        return result
+
+
+def check_users(
+    usernames: t.List[str],
+    fields: t.Sequence[str] = USER_FIELDS,
+) -> t.List[t.Dict[str, t.Any]]:
+    try:
+        snapshot = StateCollector(0, fields=fields).collect(usernames)
+        return [snapshot.get(username).to_dict(fields) for username in usernames]
+    except Exception as e:
+        return [{'username': username, 'error': str(e)} for username in usernames]
+
+
+class UserState(t.NamedTuple):
+    username: str
+    ssh_connections: int = 0
+    openvpn_connections: int = 0
+    limit_connection: int = -1
+    expiration_date: t.Optional[str] = None
+    expiration_days: int = -1
+    started_at: t.Optional[float] = None
+
+    @property
+    def count_connection(self) -> int:
+        return self.ssh_connections + self.openvpn_connections
+
+    @property
+    def time_online(self) -> t.Optional[str]:
+        if self.started_at is None:
+            return None
+
+        return format_elapsed(time.time() - self.started_at)
+
+    def to_dict(self, fields: t.Sequence[str] = USER_FIELDS) -> t.Dict[str, t.Any]:
+        result = {'username': self.username}
+        result.update((name, getattr(self, name)) for name in fields)
+        result['version'] = __version__
+        return result
+
+
+class Snapshot(t.NamedTuple):
+    users: t.Mapping[str, UserState]
+    created_at: float = 0.0
+
+    @property
+    def is_ready(self) -> bool:
+        return self.created_at > 0
+
+    def get(self, username: str) -> UserState:
+        return self.users.get(username) or UserState(username)
+
+
+class StateCollector(threading.Thread):
+    def __init__(
+        self,
+        interval: float = 2.0,
+        ssh_manager: t.Optional[SSHManager] = None,
+        openvpn_manager: t.Optional[OpenVPNManager] = None,
+        fields: t.Sequence[str] = USER_FIELDS,
+    ):
+        super(StateCollector, self).__init__()
+        self.daemon = True
+
+        self.interval = interval
+        self.fields = fields
+        self.ssh_manager = ssh_manager or SSHManager()
+        self.openvpn_manager = openvpn_manager or OpenVPNManager()
+
+        self.snapshot = Snapshot(types.MappingProxyType({}))
+        self.listeners: t.List[t.Callable[[Snapshot], None]] = []
+        self.is_running = False
+        self.__stopped = threading.Event()
+
+    def list_users(self) -> t.List[str]:
+        users = PasswdIndex.shared().users
+        known = set(users)
+
+        limits = ConnectionLimitIndex.of().data
+        users.extend(username for username in limits if username not in known)
+        return users
+
+    def iter_states(self, usernames: t.Optional[t.Iterable[str]] = None) -> t.Iterator[UserState]:
+        usernames = list(usernames) if usernames is not None else self.list_users()
+        fields = set(self.fields)
+
+        sessions = {}
+        if fields & {'count_connection', 'time_online'}:
+            sessions = self.ssh_manager.process_index.refresh(force=True)
+
+        openvpn = {}
+        if 'count_connection' in fields:
+            openvpn = self.openvpn_manager.count_all_connections(usernames)
+
+        limits = ConnectionLimitIndex.of().data if 'limit_connection' in fields else {}
+
+        expirations = None
+        if fields & {'expiration_date', 'expiration_days'}:
+            expirations = ShadowExpirationIndex.shared()
+            today = expirations.today()
+
+        for username in usernames:
+            uid = get_uid(username)
+            ssh_sessions = sessions.get(uid, []) if uid is not None else []
+
+            state = UserState(
+                username=username,
+                ssh_connections=len(ssh_sessions),
+                openvpn_connections=openvpn.get(username, 0),
+                limit_connection=limits.get(username, -1),
+                started_at=min((session.started_at for session in ssh_sessions), default=None),
+            )
+
+            if expirations is not None:
+                state = state._replace(
+                    expiration_date=expirations.get_expiration_date(username),
+                    expiration_days=expirations.get_expiration_days(username, today),
+                )
+
+            yield state
+
+    def collect(self, usernames: t.Optional[t.Iterable[str]] = None) -> Snapshot:
+        users = {state.username: state for state in self.iter_states(usernames)}
+        return Snapshot(types.MappingProxyType(users), time.time())
+
+    def update(self) -> Snapshot:
+        with metrics.timer('checker_snapshot_duration_seconds'):
+            self.snapshot = self.collect()
+
+        for listener in self.listeners:
+            listener(self.snapshot)
+
+        return self.snapshot
+
+    def run(self):
+        self.is_running = True
+        while self.is_running:
+            try:
+                self.update()
+            except Exception as e:
+                logger.error('Collector error: %s' % e)
+                metrics.inc('checker_errors_total', (('source', 'collector'),))
+
+            self.__stopped.wait(self.interval)
+
+    def stop(self):
+        self.is_running = False
+        self.__stopped.set()
+
+
+class LimitEnforcer(threading.Thread):
+    def __init__(
+        self,
+        collector: StateCollector,
+        interval: float = 2.0,
+        ssh_manager: t.Optional[SSHManager] = None,
+        openvpn_manager: t.Optional[OpenVPNManager] = None,
+    ):
+        super(LimitEnforcer, self).__init__()
+        self.daemon = True
+
+        self.collector = collector
+        self.interval = interval
+        self.ssh_manager = ssh_manager or collector.ssh_manager
+        self.openvpn_manager = openvpn_manager or collector.openvpn_manager
+
+        self.enforced_at = 0.0
+        self.last_kills = 0
+        self.is_running = False
+        self.__stopped = threading.Event()
+
+        metrics.register('checker_enforce_last_kills', lambda: [((), self.last_kills)])
+
+    @staticmethod
+    def violations(snapshot: Snapshot) -> t.List[UserState]:
+        return [
+            state
+            for state in snapshot.users.values()
+            if 0 <= state.limit_connection < state.count_connection
+        ]
+
+    def kill(self, source: str, session: t.Any) -> bool:
+        try:
+            if source == 'ssh':
+                return self.ssh_manager.kill_session(session)
+
+            return self.openvpn_manager.kill_session(session)
+        except Exception as e:
+            logger.error('Enforce kill error: %s' % e)
+            metrics.inc('checker_errors_total', (('source', 'enforce'),))
+            return False
+
+    def enforce(self, snapshot: Snapshot) -> int:
+        users = self.violations(snapshot)
+        if not users:
+            return 0
+
+        # Recount from live sessions, so kills from an earlier tick are not repeated.
+        sessions = self.ssh_manager.process_index.refresh(force=True)
+        openvpn = self.openvpn_manager.get_sessions()
+
+        kills = 0
+        for state in users:
+            uid = get_uid(state.username)
+            candidates = [
+                (session.started_at, 'ssh', session)
+                for session in (sessions.get(uid, []) if uid is not None else [])
+            ]
+            candidates += [
+                (session.connected_since or 0.0, 'openvpn', session)
+                for session in openvpn.get(state.username, [])
+            ]
+
+            excess = len(candidates) - state.limit_connection
+            if excess <= 0:
+                continue
+
+            killed = 0
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+            for _, source, session in candidates[:excess]:
+                if self.kill(source, session):
+                    killed += 1
+                    metrics.inc('checker_enforce_kills_total', (('source', source),))
+
+            kills += killed
+            logger.info(
+                'Enforced limit for %s: %d/%d connections, %d/%d killed'
+                % (state.username, len(candidates), state.limit_connection, killed, excess)
+            )
+
+        return kills
+
+    def tick(self) -> int:
+        snapshot = self.collector.snapshot
+        if not snapshot.is_ready or snapshot.created_at <= self.enforced_at:
+            return 0
+
+        with metrics.timer('checker_enforce_duration_seconds'):
+            self.last_kills = self.enforce(snapshot)
+
+        self.enforced_at = snapshot.created_at
+        metrics.observe('checker_enforce_latency_seconds', time.time() - snapshot.created_at)
+        return self.last_kills
+
+    def run(self):
+        self.is_running = True
+        while self.is_running:
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error('Enforcer error: %s' % e)
+                metrics.inc('checker_errors_total', (('source', 'enforce'),))
+
+            self.__stopped.wait(self.interval)
+
+    def stop(self):
+        self.is_running = False
+        self.__stopped.set()
+
+
+class ConnectionHistory:
+    MAX_COUNT = 255
+
+    def __init__(self, size: int = 1800):
+        self.size = size
+        self.ticks = 0
+        self.timestamps = array.array('d', bytes(8 * size))
+        self.series: t.Dict[str, array.array] = {}
+        self.last: t.Dict[str, int] = {}
+
+        self.lock = threading.Lock()
+
+        metrics.register('checker_history_bytes', lambda: [((), self.memory_size)])
+
+    @property
+    def memory_size(self) -> int:
+        return self.size * (self.timestamps.itemsize + len(self.series))
+
+    def fill(self, series: array.array, last: int, tick: int) -> None:
+        # Ticks where the user was offline are never written, so zero them before reuse.
+        for past in range(max(last + 1, tick - self.size + 1), tick):
+            series[past % self.size] = 0
+
+    def record(self, snapshot: Snapshot) -> None:
+        with self.lock:
+            tick = self.ticks
+            slot = tick % self.size
+            self.timestamps[slot] = snapshot.created_at
+
+            for username, state in snapshot.users.items():
+                count = state.ssh_connections + state.openvpn_connections
+                if count <= 0:
+                    continue
+
+                series = self.series.get(username)
+                if series is None:
+                    series = self.series[username] = array.array('B', bytes(self.size))
+                elif self.last[username] < tick - 1:
+                    self.fill(series, self.last[username], tick)
+
+                series[slot] = count if count < self.MAX_COUNT else self.MAX_COUNT
+                self.last[username] = tick
+
+            self.ticks += 1
+            if self.ticks % self.size == 0:
+                self.prune()
+
+    def prune(self) -> None:
+        for username in [name for name, last in self.last.items() if last < self.ticks - self.size]:
+            del self.series[username]
+            del self.last[username]
+
+    def samples(self, username: str, window: float = 0.0) -> t.List[t.Tuple[float, int]]:
+        cutoff = time.time() - window if window > 0 else 0.0
+
+        with self.lock:
+            series = self.series.get(username)
+            last = self.last.get(username, -1)
+            samples = []
+
+            for tick in range(max(self.ticks - self.size, 0), self.ticks):
+                slot = tick % self.size
+                if self.timestamps[slot] < cutoff:
+                    continue
+
+                value = series[slot] if series is not None and tick <= last else 0
+                samples.append((self.timestamps[slot], value))
+
+        return samples
+
+    @staticmethod
+    def downsample(
+        samples: t.List[t.Tuple[float, int]], points: int
+    ) -> t.List[t.Tuple[float, int]]:
+        if points <= 0 or len(samples) <= points:
+            return samples
+
+        step = math.ceil(len(samples) / points)
+        return [
+            (samples[i][0], max(value for _, value in samples[i : i + step]))
+            for i in range(0, len(samples), step)
+        ]
+
+    def query(self, username: str, window: float = 0.0, points: int = 60) -> t.Dict[str, t.Any]:
+        samples = self.samples(username, window)
+        return {
+            'username': username,
+            'samples': len(samples),
+            'max': max((value for _, value in samples), default=0),
+            'points': [[round(at, 3), value] for at, value in self.downsample(samples, points)],
+        }
+
+
+class StateStore:
+    PATH = '/etc/checker/state.bin'
+    MAGIC = b'CHKSTATE'
+    VERSION = 1
+    MAX_AGE = 300.0
+
+    HEADER = struct.Struct('<8sHdI')
+    TEXT = struct.Struct('<H')
+    USER = struct.Struct('<HHiid')
+    HISTORY = struct.Struct('<IQI')
+    SERIES = struct.Struct('<q')
+
+    NONE = 0xFFFF
+
+    def __init__(
+        self,
+        path: t.Optional[str] = None,
+        interval: float = 30.0,
+        history: t.Optional[ConnectionHistory] = None,
+    ):
+        self.path = path or self.PATH
+        self.interval = interval
+        self.history = history
+        self.saved_at = 0.0
+
+    def pack_text(self, value: t.Optional[str]) -> bytes:
+        if value is None:
+            return self.TEXT.pack(self.NONE)
+
+        data = value.encode('utf-8')[: self.NONE - 1]
+        return self.TEXT.pack(len(data)) + data
+
+    def unpack_text(self, data: t.Any, offset: int) -> t.Tuple[t.Optional[str], int]:
+        (length,) = self.TEXT.unpack_from(data, offset)
+        offset += self.TEXT.size
+        if length == self.NONE:
+            return None, offset
+
+        return bytes(data[offset : offset + length]).decode('utf-8'), offset + length
+
+    def dump(self, snapshot: Snapshot) -> bytes:
+        parts = [
+            self.HEADER.pack(self.MAGIC, self.VERSION, snapshot.created_at, len(snapshot.users))
+        ]
+
+        for state in snapshot.users.values():
+            parts.append(self.pack_text(state.username))
+            parts.append(
+                self.USER.pack(
+                    min(state.ssh_connections, 0xFFFF),
+                    min(state.openvpn_connections, 0xFFFF),
+                    state.limit_connection,
+                    state.expiration_days,
+                    state.started_at if state.started_at is not None else math.nan,
+                )
+            )
+            parts.append(self.pack_text(state.expiration_date))
+
+        history = self.history
+        if history is None:
+            parts.append(self.HISTORY.pack(0, 0, 0))
+            return b''.join(parts)
+
+        with history.lock:
+            parts.append(self.HISTORY.pack(history.size, history.ticks, len(history.series)))
+            parts.append(history.timestamps.tobytes())
+
+            for username, series in history.series.items():
+                parts.append(self.pack_text(username))
+                parts.append(self.SERIES.pack(history.last[username]))
+                parts.append(series.tobytes())
+
+        return b''.join(parts)
+
+    def save(self, snapshot: Snapshot) -> None:
+        path = self.path + '.tmp'
+
+        with open(path, 'wb') as f:
+            f.write(self.dump(snapshot))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(path, self.path)
+        self.saved_at = time.monotonic()
+
+    def maybe_save(self, snapshot: Snapshot) -> None:
+        if time.monotonic() - self.saved_at < self.interval:
+            return
+
+        try:
+            self.save(snapshot)
+        except OSError as e:
+            logger.error('State save error: %s' % e)
+            metrics.inc('checker_errors_total', (('source', 'state'),))
+
+    def parse(self, data: t.Any) -> t.Optional[Snapshot]:
+        magic, version, created_at, count = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            return None
+
+        # Sessions do not survive a reboot, so neither does their snapshot.
+        if time.time() - created_at > self.MAX_AGE or created_at < ProcessIndex().boot_time:
+            return None
+
+        offset = self.HEADER.size
+        users = {}
+
+        for _ in range(count):
+            username, offset = self.unpack_text(data, offset)
+            ssh, openvpn, limit, days, started_at = self.USER.unpack_from(data, offset)
+            offset += self.USER.size
+            expiration_date, offset = self.unpack_text(data, offset)
+
+            users[username] = UserState(
+                username=username,
+                ssh_connections=ssh,
+                openvpn_connections=openvpn,
+                limit_connection=limit,
+                expiration_date=expiration_date,
+                expiration_days=days,
+                started_at=None if math.isnan(started_at) else started_at,
+            )
+
+        size, ticks, series_count = self.HISTORY.unpack_from(data, offset)
+        offset += self.HISTORY.size
+
+        history = self.history
+        if history is not None and size == history.size:
+            if len(data) < offset + size * 8:
+                raise ValueError('truncated history')
+
+            timestamps = array.array('d', bytes(data[offset : offset + size * 8]))
+            offset += size * 8
+            series = {}
+            last = {}
+
+            for _ in range(series_count):
+                username, offset = self.unpack_text(data, offset)
+                (last[username],) = self.SERIES.unpack_from(data, offset)
+                offset += self.SERIES.size
+                if len(data) < offset + size:
+                    raise ValueError('truncated history')
+
+                series[username] = array.array('B', data[offset : offset + size])
+                offset += size
+
+            # Only a fully parsed file replaces the live history.
+            with history.lock:
+                history.ticks = ticks
+                history.timestamps = timestamps
+                history.series = series
+                history.last = last
+
+        return Snapshot(types.MappingProxyType(users), created_at)
+
+    def load(self) -> t.Optional[Snapshot]:
+        try:
+            with open(self.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    return self.parse(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+            logger.error('State load error: %s' % e)
+            return None
+
+
+class SingleFlight:
+    MAX_RESULTS = 4096
+
+    class Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, ttl: float = 1.0):
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self.__lock = threading.Lock()
+        self.__calls = {}
+        self.__results = {}
+
+    @property
+    def stats(self) -> t.Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced}
+
+    def samples(self) -> t.List[t.Tuple[Labels, int]]:
+        return [((('result', name),), value) for name, value in self.stats.items()]
+
+    def prune(self, now: float) -> None:
+        for key in [key for key, (expires_at, _) in self.__results.items() if expires_at <= now]:
+            del self.__results[key]
+
+    def do(self, key: t.Hashable, function: t.Callable[[], t.Any], cache: bool = True) -> t.Any:
+        with self.__lock:
+            now = time.monotonic()
+            cached = self.__results.get(key)
+            if cached and cached[0] > now:
+                self.hits += 1
+                return cached[1]
+
+            call = self.__calls.get(key)
+            is_leader = call is None
+
+            if is_leader:
+                call = self.__calls[key] = self.Call()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+
+                if cache and self.ttl > 0 and call.error is None:
+                    now = time.monotonic()
+                    if len(self.__results) >= self.MAX_RESULTS:
+                        self.prune(now)
+                    self.__results[key] = (now + self.ttl, call.result)
+
+            call.event.set()
+
+        return call.result
+
+
+def read_request(client: socket.socket, max_size: int = 8192 * 8) -> bytes:
+    data = b''
+
+    while b'\r\n\r\n' not in data and len(data) < max_size:
+        buf = client.recv(max_size)
+        if not buf:
+            return data
+        data += buf
+
+    head, _, body = data.partition(b'\r\n\r\n')
+    length = 0
+
+    for line in head.split(b'\r\n')[1:]:
+        name, _, value = line.partition(b':')
+        if name.strip().lower() == b'content-length' and value.strip().isdigit():
+            length = min(int(value.strip()), max_size)
+
+    while len(body) < length:
+        buf = client.recv(length - len(body))
+        if not buf:
+            break
+        body += buf
+
+    return head + b'\r\n\r\n' + body
+
+
+def build_response(
+    data: t.Any,
+    status: str = '200 OK',
+    keep_alive: bool = False,
+    headers: t.Optional[t.Dict[str, str]] = None,
+) -> bytes:
+    if isinstance(data, bytes):
+        body, content_type = data, 'text/plain; version=0.0.4; charset=utf-8'
+    else:
+        body, content_type = json.dumps(data).encode('utf-8'), 'application/json'
+
+    head = [
+        'HTTP/1.1 %s' % status,
+        'Content-Type: %s' % content_type,
+        'Content-Length: %d' % len(body),
+        'Connection: %s' % ('keep-alive' if keep_alive else 'close'),
+    ]
+    head.extend('%s: %s' % item for item in (headers or {}).items())
+    return ('\r\n'.join(head) + '\r\n\r\n').encode('utf-8') + body
+
+
+class StreamResponse:
+    CONTENT_TYPE = 'application/x-ndjson'
+    CHUNK_SIZE = 65536
+    LAST_CHUNK = b'0\r\n\r\n'
+
+    def __init__(self, items: t.Iterable[t.Any]):
+        self.items = items
+
+    def head(self, keep_alive: bool = False) -> bytes:
+        head = [
+            'HTTP/1.1 200 OK',
+            'Content-Type: %s' % self.CONTENT_TYPE,
+            'Transfer-Encoding: chunked',
+            'Connection: %s' % ('keep-alive' if keep_alive else 'close'),
+        ]
+        return ('\r\n'.join(head) + '\r\n\r\n').encode('utf-8')
+
+    def chunks(self) -> t.Iterator[bytes]:
+        buffer = []
+        size = 0
+
+        for item in self.items:
+            line = json.dumps(item).encode('utf-8') + b'\n'
+            buffer.append(line)
+            size += len(line)
+
+            if size >= self.CHUNK_SIZE:
+                yield self.encode_chunk(b''.join(buffer))
+                buffer = []
+                size = 0
+
+        if buffer:
+            yield self.encode_chunk(b''.join(buffer))
+
+        yield self.LAST_CHUNK
+
+    @staticmethod
+    def encode_chunk(data: bytes) -> bytes:
+        return b'%x\r\n' % len(data) + data + b'\r\n'
+
+
+class ChangeEvent(t.NamedTuple):
+    version: int
+    created_at: float
+    users: t.Dict[str, int]
+    message: bytes = b''
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        return {'version': self.version, 'time': self.created_at, 'users': self.users}
+
+
+class Subscription(t.NamedTuple):
+    hub: t.Union['EventHub', 'EventRelay']
+    since: t.Optional[int] = None
+    stream: bool = True
+
+    def attach(self, sock: socket.socket) -> None:
+        self.hub.subscribe(sock, self)
+
+
+class Subscriber:
+    def __init__(self, sock: socket.socket, subscription: Subscription, expires_at: float):
+        self.sock = sock
+        self.stream = subscription.stream
+        self.version = subscription.since
+        self.expires_at = expires_at
+
+        self.pending = b''
+        self.closing = False
+        self.events = selectors.EVENT_READ
+
+
+class EventHub(threading.Thread):
+    MAX_EVENTS = 1024
+    MAX_PENDING = 256 * 1024
+    POLL_TIMEOUT = 30.0
+    HEARTBEAT = 15.0
+
+    STREAM_HEAD = (
+        b'HTTP/1.1 200 OK\r\n'
+        b'Content-Type: text/event-stream\r\n'
+        b'Cache-Control: no-cache\r\n'
+        b'Connection: keep-alive\r\n\r\n'
+    )
+
+    def __init__(self, address: t.Optional[bytes] = None):
+        super(EventHub, self).__init__()
+        self.daemon = True
+
+        self.version = 0
+        self.counts: t.Optional[t.Dict[str, int]] = None
+        self.events: t.Deque[ChangeEvent] = collections.deque(maxlen=self.MAX_EVENTS)
+        self.is_running = False
+
+        self.__lock = threading.Lock()
+        self.__incoming = collections.deque()
+        self.__subscribers: t.Set[Subscriber] = set()
+        self.__selector = selectors.DefaultSelector()
+
+        self.__wakeup, self.__notify = socket.socketpair()
+        self.__wakeup.setblocking(False)
+        self.__notify.setblocking(False)
+        self.__selector.register(self.__wakeup, selectors.EVENT_READ)
+
+        # With several processes the other workers pass their /EVENTS sockets here, so every
+        # subscriber shares one version sequence.
+        self.__inbox = None
+        if address:
+            self.__inbox = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.__inbox.bind(address)
+            self.__inbox.setblocking(False)
+            self.__selector.register(self.__inbox, selectors.EVENT_READ)
+
+        metrics.register('checker_event_subscribers', self.samples)
+
+    def samples(self) -> t.List[t.Tuple[Labels, int]]:
+        streams = sum(1 for subscriber in list(self.__subscribers) if subscriber.stream)
+        polls = len(self.__subscribers) - streams
+        return [((('mode', 'stream'),), streams), ((('mode', 'poll'),), polls)]
+
+    def wakeup(self) -> None:
+        try:
+            self.__notify.send(b'\0')
+        except OSError:
+            pass
+
+    def publish(self, snapshot: Snapshot) -> t.Optional[ChangeEvent]:
+        counts = {username: state.count_connection for username, state in snapshot.users.items()}
+
+        with self.__lock:
+            previous, self.counts = self.counts, counts
+            if previous is None:
+                self.wakeup()
+                return None
+
+            changes = {
+                username: count
+                for username, count in counts.items()
+                if previous.get(username, 0) != count
+            }
+            changes.update(
+                (username, 0)
+                for username, count in previous.items()
+                if count and username not in counts
+            )
+            if not changes:
+                return None
+
+            self.version += 1
+            event = ChangeEvent(self.version, snapshot.created_at, changes)
+            event = event._replace(
+                message=b'id: %d\nevent: change\ndata: %s\n\n'
+                % (event.version, json.dumps(event.to_dict()).encode('utf-8'))
+            )
+            self.events.append(event)
+
+        metrics.inc('checker_events_total')
+        self.wakeup()
+        return event
+
+    def subscribe(self, sock: socket.socket, subscription: Subscription) -> None:
+        self.__incoming.append((sock, subscription))
+        self.wakeup()
+
+    def receive(self) -> None:
+        size = socket.CMSG_SPACE(array.array('i').itemsize)
+
+        while True:
+            try:
+                data, ancdata, _, _ = self.__inbox.recvmsg(4096, size)
+            except BlockingIOError:
+                break
+
+            info = json.loads(data)
+            subscription = Subscription(self, info['since'], info['stream'])
+
+            for level, kind, fds in ancdata:
+                if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+                    items = array.array('i')
+                    items.frombytes(fds[: len(fds) - len(fds) % items.itemsize])
+                    self.__incoming.extend((socket.socket(fileno=fd), subscription) for fd in items)
+
+    def changes_since(self, version: t.Optional[int]) -> t.Optional[t.List[ChangeEvent]]:
+        with self.__lock:
+            if version is None or version < 0 or version > self.version:
+                return None
+
+            if not self.events or version < self.events[0].version - 1:
+                return None
+
+            return list(itertools.islice(self.events, version - self.events[0].version + 1, None))
+
+    def reset(self) -> t.Dict[str, t.Any]:
+        with self.__lock:
+            users = {username: count for username, count in (self.counts or {}).items() if count}
+            return {'version': self.version, 'reset': True, 'users': users}
+
+    def payload(
+        self, subscriber: Subscriber, cache: t.Dict[t.Any, t.Tuple[int, bytes]]
+    ) -> t.Optional[bytes]:
+        with self.__lock:
+            if self.counts is None or subscriber.version == self.version:
+                return None
+
+        events = self.changes_since(subscriber.version)
+        key = (subscriber.stream, subscriber.version if events is not None else None)
+
+        # The version comes from the data itself: a publish racing this call is left for the
+        # next broadcast instead of being skipped.
+        if key not in cache:
+            if events is None:
+                data = self.reset()
+                if subscriber.stream:
+                    cache[key] = data['version'], b'id: %d\nevent: reset\ndata: %s\n\n' % (
+                        data['version'],
+                        json.dumps(data).encode('utf-8'),
+                    )
+                else:
+                    cache[key] = data['version'], build_response(data)
+            elif subscriber.stream:
+                cache[key] = events[-1].version, b''.join(event.message for event in events)
+            else:
+                data = {'version': events[-1].version, 'events': [e.to_dict() for e in events]}
+                cache[key] = data['version'], build_response(data)
+
+        subscriber.version, message = cache[key]
+        return message
+
+    def accept(self) -> None:
+        while self.__incoming:
+            sock, subscription = self.__incoming.popleft()
+            sock.setblocking(False)
+
+            subscriber = Subscriber(sock, subscription, time.monotonic() + self.POLL_TIMEOUT)
+            self.__subscribers.add(subscriber)
+            self.__selector.register(sock, subscriber.events, subscriber)
+
+            if subscriber.stream:
+                self.send(subscriber, self.STREAM_HEAD)
+
+    def drop(self, subscriber: Subscriber) -> None:
+        if subscriber not in self.__subscribers:
+            return
+
+        self.__subscribers.discard(subscriber)
+        self.__selector.unregister(subscriber.sock)
+        subscriber.sock.close()
+
+    def send(self, subscriber: Subscriber, data: bytes) -> None:
+        subscriber.pending += data
+
+        if subscriber.pending:
+            try:
+                sent = subscriber.sock.send(subscriber.pending)
+                subscriber.pending = subscriber.pending[sent:]
+            except BlockingIOError:
+                pass
+            except OSError:
+                self.drop(subscriber)
+                return
+
+        if len(subscriber.pending) > self.MAX_PENDING:
+            metrics.inc('checker_event_dropped_total')
+            self.drop(subscriber)
+            return
+
+        if subscriber.closing and not subscriber.pending:
+            self.drop(subscriber)
+            return
+
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if subscriber.pending else 0)
+        if events != subscriber.events:
+            subscriber.events = events
+            self.__selector.modify(subscriber.sock, events, subscriber)
 
-        response = requests.get(CheckerManager.RAW_URL_DATA)
-        return response.text
+    def read(self, subscriber: Subscriber) -> None:
+        try:
+            if subscriber.sock.recv(4096):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
 
-    @staticmethod
-    def check_update() -> t.Union[bool, str]:
-        data = CheckerManager.get_data()
+        self.drop(subscriber)
+
+    def broadcast(self) -> None:
+        cache = {}
+        for subscriber in list(self.__subscribers):
+            if subscriber.closing:
+                continue
+
+            data = self.payload(subscriber, cache)
+            if data is None:
+                continue
+
+            subscriber.closing = not subscriber.stream
+            self.send(subscriber, data)
+
+    def expire(self, now: float, heartbeat: bool) -> None:
+        for subscriber in list(self.__subscribers):
+            if subscriber.closing:
+                continue
+
+            if subscriber.stream:
+                if heartbeat:
+                    self.send(subscriber, b': ping\n\n')
+            elif subscriber.expires_at <= now:
+                subscriber.closing = True
+                self.send(subscriber, build_response({'version': subscriber.version, 'events': []}))
+
+    def timeout(self, now: float, heartbeat_at: float) -> float:
+        deadlines = [heartbeat_at]
+        deadlines.extend(
+            subscriber.expires_at
+            for subscriber in self.__subscribers
+            if not subscriber.stream and not subscriber.closing
+        )
+        return max(min(deadlines) - now, 0.0)
 
-        if data:
-            version = data.split('__version__ = ')[1].split('\n')[0].strip('\'')
-            return version != __version__, version
+    def run(self):
+        self.is_running = True
+        heartbeat_at = time.monotonic() + self.HEARTBEAT
 
-        return False, __version__
+        while self.is_running:
+            try:
+                ready = self.__selector.select(self.timeout(time.monotonic(), heartbeat_at))
+
+                for key, mask in ready:
+                    if key.fileobj is self.__inbox:
+                        self.receive()
+                        continue
+
+                    if key.data is None:
+                        while True:
+                            try:
+                                if not self.__wakeup.recv(4096):
+                                    break
+                            except BlockingIOError:
+                                break
+                        continue
+
+                    if mask & selectors.EVENT_READ:
+                        self.read(key.data)
+                    if mask & selectors.EVENT_WRITE:
+                        self.send(key.data, b'')
+
+                self.accept()
+                self.broadcast()
+
+                now = time.monotonic()
+                heartbeat = now >= heartbeat_at
+                if heartbeat:
+                    heartbeat_at = now + self.HEARTBEAT
+
+                self.expire(now, heartbeat)
+            except Exception as e:
+                logger.error('Event hub error: %s' % e)
+                metrics.inc('checker_errors_total', (('source', 'events'),))
 
-    @staticmethod
-    def update() -> bool:
-        success, version = CheckerManager.check_update()
-        if not success:
-            logger.info('No update available')
-            return False
+        for subscriber in list(self.__subscribers):
+            self.drop(subscriber)
 
-        logger.info('New version available: %s' % version)
+    def stop(self):
+        self.is_running = False
+        self.wakeup()
 
-        data = CheckerManager.get_data()
-        if not data:
-            return False
 
-        with open(__file__, 'w') as f:
-            f.write(data)
+class EventRelay:
+    TIMEOUT = 1.0
 
-        CheckerManager.create_executable()
-        ServiceManager().restart()
-        return True
+    def __init__(self, address: bytes):
+        self.address = address
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.settimeout(self.TIMEOUT)
 
-    @staticmethod
-    def remove_executable() -> None:
-        os.remove(CheckerManager.EXECUTABLE_FILE)
+    def subscribe(self, sock: socket.socket, subscription: Subscription) -> None:
+        data = json.dumps({'since': subscription.since, 'stream': subscription.stream})
+        fds = array.array('i', [sock.fileno()])
 
+        try:
+            self.sock.sendmsg(
+                [data.encode('utf-8')],
+                [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds)],
+                0,
+                self.address,
+            )
+        except OSError as e:
+            logger.error('Event relay error: %s' % e)
+            metrics.inc('checker_errors_total', (('source', 'events'),))
+            reject(sock, 'events')
+        finally:
+            sock.close()
 
-def check_user(username: str) -> t.Dict[str, t.Any]:
-    try:
-        checker = CheckerUserManager(username)
 
-        count = checker.get_connections()
-        expiration_date = checker.get_expiration_date()
-        expiration_days = checker.get_expiration_days(expiration_date)
-        limit_connection = checker.get_limiter_connection()
-        time_online = checker.get_time_online()
+class MetricsPeers(threading.Thread):
+    TIMEOUT = 0.5
+    MAX_SIZE = 1 << 20
 
-        return {
-            'username': username,
-            'count_connection': count,
-            'limit_connection': limit_connection,
-            'expiration_date': expiration_date,
-            'expiration_days': expiration_days,
-            'time_online': time_online,
-            'version': __version__,
-        }
-    except Exception as e:
-        return {'error': str(e)}
+    def __init__(self, port: int, slot: int, processes: int):
+        super(MetricsPeers, self).__init__()
+        self.daemon = True
 
+        self.addresses = [b'\0checker-metrics-%d-%d' % (port, peer) for peer in range(processes)]
+        self.peers = [address for peer, address in enumerate(self.addresses) if peer != slot]
 
-def kill_user(username: str) -> dict:
-    result = {
-        'success': True,
-        'error': None,
-    }
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.addresses[slot])
 
-    try:
-        checker = CheckerUserManager(username)
-        checker.kill_connection()
-        return result
-    except Exception as e:
-        result['success'] = False
-        result['error'] = str(e)
+    def run(self) -> None:
+        while True:
+            try:
+                _, address = self.sock.recvfrom(1)
+                self.sock.sendto(json.dumps(metrics.export()).encode('utf-8'), address)
+            except OSError as e:
+                logger.error('Metrics peer error: %s' % e)
+
+    def collect(self) -> t.List[t.Dict[str, t.Any]]:
+        # Every worker is asked for its live registry at scrape time, so the totals never move
+        # backwards no matter which process the scrape lands on.
+        exports = []
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.bind(b'')
+
+            pending = 0
+            for address in self.peers:
+                try:
+                    sock.sendto(b'\0', address)
+                    pending += 1
+                except OSError:
+                    pass
+
+            deadline = time.monotonic() + self.TIMEOUT
+            while pending and time.monotonic() < deadline:
+                try:
+                    sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                    exports.append(json.loads(sock.recv(self.MAX_SIZE)))
+                    pending -= 1
+                except (OSError, ValueError):
+                    break
+
+        if pending:
+            logger.error('Metrics missing from %d worker processes' % pending)
+            metrics.inc('checker_errors_total', (('source', 'metrics'),))
+
+        return exports
 
 
 class ParserServerRequest:
     def __init__(self, data: bytes):
         self.data = data
+        self.method = None
         self.command = None
         self.content = None
+        self.query = {}
+        self.headers = {}
+
+        self.commands_allowed = ['CHECK', 'KILL']
+
+    @staticmethod
+    def parse_usernames(body: str) -> t.List[str]:
+        data = json.loads(body)
+
+        if isinstance(data, dict):
+            data = data.get('usernames', [])
 
-        self.commands_allowed = ['CHECK' 'KILL']
+        if not isinstance(data, list):
+            raise ValueError('Expected a list of usernames')
+
+        return [str(username) for username in data]
 
     def parse(self) -> None:
         try:
             data = self.data.decode('utf-8')
+            head, _, body = data.partition('\r\n\r\n')
+
+            lines = head.split('\r\n')
+            self.method, path = lines[0].split(' ')[:2]
 
-            first_line = data.split('\n')[0]
-            path = first_line.split(' ')[1]
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                self.headers[name.strip().lower()] = value.strip()
 
-            self.command = path.split('/')[1]
-            self.content = path.split('/')[2].split('?')[0]
+            url = urlparse(path)
+            self.query = parse_qs(url.query, keep_blank_values=True)
+
+            parts = url.path.split('/')
+            self.command = parts[1]
+            self.content = parts[2] if len(parts) > 2 else ''
+
+            if self.method.upper() == 'POST' and body.strip():
+                self.content = self.parse_usernames(body)
+            elif ',' in self.content:
+                self.content = [username for username in self.content.split(',') if username]
 
         except Exception:
+            self.method = None
             self.command = None
             self.content = None
 
+    @property
+    def fields(self) -> t.Optional[t.List[str]]:
+        if 'fields' not in self.query:
+            return None
+
+        return [name for value in self.query['fields'] for name in value.split(',') if name]
+
+    def flag(self, name: str) -> bool:
+        values = self.query.get(name)
+        return bool(values) and values[-1].lower() not in ('0', 'false', 'no')
+
+    @property
+    def is_poll(self) -> bool:
+        return 'since' in self.query
+
+    @property
+    def since(self) -> t.Optional[int]:
+        values = self.query.get('since') or [self.headers.get('last-event-id', '')]
+
+        try:
+            return int(values[-1])
+        except ValueError:
+            return None
+
 
 class FunctionExecutor:
-    def __init__(self, command: str, content: str):
+    single_flight = SingleFlight()
+    metrics.register('checker_singleflight_total', single_flight.samples)
+
+    exclude = []
+    event_hub: t.Optional[t.Union[EventHub, EventRelay]] = None
+    metrics_peers: t.Optional[MetricsPeers] = None
+    history: t.Optional[ConnectionHistory] = None
+
+    def __init__(
+        self,
+        command: str,
+        content: t.Union[str, t.List[str]],
+        collector: t.Optional[StateCollector] = None,
+        fields: t.Optional[t.List[str]] = None,
+        online: bool = False,
+        over_limit: bool = False,
+        since: t.Optional[int] = None,
+        stream: bool = True,
+        query: t.Optional[t.Dict[str, t.List[str]]] = None,
+    ):
         self.command = command
         self.content = content
+        self.collector = collector
+        self.fields = select_fields(fields, self.exclude)
+        self.online = online
+        self.over_limit = over_limit
+        self.since = since
+        self.stream = stream
+        self.query = query or {}
+
+    @classmethod
+    def of(
+        cls, request: ParserServerRequest, collector: t.Optional[StateCollector] = None
+    ) -> 'FunctionExecutor':
+        return cls(
+            request.command,
+            request.content,
+            collector,
+            request.fields,
+            request.flag('online'),
+            request.flag('over_limit'),
+            request.since,
+            not request.is_poll,
+            request.query,
+        )
+
+    def check(self) -> t.Union[t.Dict[str, t.Any], t.List[t.Dict[str, t.Any]]]:
+        snapshot = self.collector.snapshot if self.collector else None
+        fields = self.fields
+
+        if isinstance(self.content, list):
+            if snapshot and snapshot.is_ready:
+                return [snapshot.get(username).to_dict(fields) for username in self.content]
+
+            usernames = tuple(self.content)
+            return self.single_flight.do(
+                ('CHECK', usernames, fields), lambda: check_users(list(usernames), fields)
+            )
+
+        if snapshot and snapshot.is_ready:
+            return snapshot.get(self.content).to_dict(fields)
+
+        username = self.content
+        return self.single_flight.do(
+            ('CHECK', username, fields), lambda: check_user(username, fields)
+        )
+
+    def users(self) -> StreamResponse:
+        snapshot = self.collector.snapshot if self.collector else None
+
+        if snapshot and snapshot.is_ready:
+            states = iter(snapshot.users.values())
+        else:
+            fields = set(self.fields)
+            if self.online or self.over_limit:
+                fields.add('count_connection')
+            if self.over_limit:
+                fields.add('limit_connection')
+
+            states = StateCollector(0, fields=select_fields(fields)).iter_states()
+
+        def items() -> t.Iterator[t.Dict[str, t.Any]]:
+            for state in states:
+                if self.online and state.count_connection <= 0:
+                    continue
+
+                if self.over_limit and not 0 <= state.limit_connection < state.count_connection:
+                    continue
+
+                yield state.to_dict(self.fields)
+
+        return StreamResponse(items())
+
+    def events(self) -> t.Union[Subscription, t.Dict[str, t.Any]]:
+        if self.event_hub is None:
+            return {'error': 'Events require the state collector'}
+
+        return Subscription(self.event_hub, self.since, self.stream)
+
+    def history_of(self) -> t.Dict[str, t.Any]:
+        if self.history is None:
+            return {'error': 'History requires the state collector'}
+
+        try:
+            window = float(self.query.get('window', ['0'])[-1])
+            points = int(self.query.get('points', ['60'])[-1])
+        except ValueError:
+            return {'error': 'Invalid window or points'}
+
+        if isinstance(self.content, list):
+            return {'error': 'History takes a single username'}
+
+        return self.history.query(self.content, window, points)
+
+    def kill(self) -> t.Union[t.Dict[str, t.Any], t.List[t.Dict[str, t.Any]]]:
+        if isinstance(self.content, list):
+            return [self.kill_one(username) for username in self.content]
+
+        return self.kill_one(self.content)
+
+    def kill_one(self, username: str) -> t.Dict[str, t.Any]:
+        return self.single_flight.do(('KILL', username), lambda: kill_user(username), False)
+
+    @property
+    def is_blocking(self) -> bool:
+        if self.name in ('CHECK', 'USERS'):
+            return not (self.collector and self.collector.snapshot.is_ready)
+
+        return self.name != 'METRICS' or self.metrics_peers is not None
+
+    @property
+    def name(self) -> str:
+        if not self.command or self.content is None:
+            return 'INVALID'
+
+        command = self.command.upper()
+        commands = ('CHECK', 'KILL', 'METRICS', 'USERS', 'EVENTS', 'HISTORY')
+        return command if command in commands else 'OTHER'
+
+    def dispatch(self) -> t.Any:
+        if self.name == 'INVALID':
+            return {'error': 'Invalid request'}
+
+        if self.name == 'CHECK':
+            return self.check()
+
+        if self.name == 'KILL':
+            return self.kill()
 
-    def execute(self) -> t.Dict[str, t.Any]:
-        if self.command.upper() == 'CHECK':
-            return check_user(self.content)
+        if self.name == 'METRICS':
+            peers = self.metrics_peers.collect() if self.metrics_peers else []
+            return metrics.render(peers).encode('utf-8')
 
-        if self.command.upper() == 'KILL':
-            return kill_user(self.content)
+        if self.name == 'USERS':
+            return self.users()
+
+        if self.name == 'EVENTS':
+            return self.events()
+
+        if self.name == 'HISTORY':
+            return self.history_of()
 
         return {'error': 'Command not allowed'}
 
+    def execute(self) -> t.Any:
+        labels = (('command', self.name),)
+        metrics.inc('checker_requests_total', labels)
+
+        with metrics.timer('checker_request_duration_seconds', labels):
+            return self.dispatch()
+
+
+def fail(client: socket.socket, started: bool = False) -> None:
+    # A response that already started streaming can only be cut short.
+    try:
+        if not started:
+            client.settimeout(0)
+            client.send(build_response({'error': 'Internal error'}, '500 Internal Server Error'))
+    except OSError:
+        pass
+    finally:
+        client.close()
+
+
+def reject(client: socket.socket, reason: str, retry_after: int = 1) -> None:
+    metrics.inc('checker_shed_total', (('reason', reason),))
+
+    try:
+        response = build_response(
+            {'error': 'Server busy'},
+            '503 Service Unavailable',
+            headers={'Retry-After': str(retry_after)},
+        )
+        client.settimeout(0)
+        client.send(response)
+    except OSError:
+        pass
+    finally:
+        client.close()
+
 
 class WorkerThread(threading.Thread):
-    def __init__(self, queue: queue.Queue):
+    def __init__(
+        self,
+        queue: queue.Queue,
+        collector: t.Optional[StateCollector] = None,
+        deadline: float = 0.0,
+    ):
         super(WorkerThread, self).__init__()
         self.queue = queue
+        self.collector = collector
+        self.deadline = deadline
         self.daemon = True
 
         self.is_running = False
 
-    def parse_request(self, data: bytes) -> t.Dict[str, t.Any]:
+    def parse_request(self, data: bytes) -> t.Any:
         request = ParserServerRequest(data.strip())
         request.parse()
 
-        function_executor = FunctionExecutor(request.command, request.content)
+        function_executor = FunctionExecutor.of(request, self.collector)
         return function_executor.execute()
 
+    def is_expired(self, accepted_at: float) -> bool:
+        return self.deadline > 0 and time.monotonic() - accepted_at > self.deadline
+
     def run(self):
         self.is_running = True
         while self.is_running:
+            client, started = None, False
             try:
-                client, addr = self.queue.get()
-                logger.info('Client connected: %s' % addr)
+                client, addr, accepted_at = self.queue.get()
+                if self.is_expired(accepted_at):
+                    reject(client, 'deadline')
+                    continue
 
-                data = client.recv(8192 * 8)
+                logger.info('Client connected: %s' % (addr,))
+
+                data = read_request(client)
                 if not data:
+                    client.close()
+                    continue
+
+                if self.is_expired(accepted_at):
+                    reject(client, 'deadline')
+                    continue
+
+                response = self.parse_request(data)
+
+                if isinstance(response, Subscription):
+                    response.attach(client)
                     continue
 
-                response_data = 'HTTP/1.1 200 OK\r\n Content-Type: application/json\r\n\r\n'
-                response_data += json.dumps(self.parse_request(data))
+                if isinstance(response, StreamResponse):
+                    started = True
+                    client.sendall(response.head())
+                    for chunk in response.chunks():
+                        client.sendall(chunk)
+                else:
+                    client.sendall(build_response(response))
 
-                client.send(response_data.encode('utf-8'))
                 client.close()
 
-                logger.info('Client disconnected: %s' % addr)
+                logger.info('Client disconnected: %s' % (addr,))
             except Exception as e:
                 logger.error(e)
+                metrics.inc('checker_errors_total', (('source', 'request'),))
+
+                if client is not None:
+                    fail(client, started)
 
     def stop(self):
         self.is_running = False
 
 
 class ThreadPool:
-    def __init__(self, max_workers: int = 10):
-        self.queue = queue.Queue()
+    def __init__(
+        self,
+        max_workers: int = 10,
+        collector: t.Optional[StateCollector] = None,
+        max_queue: int = 0,
+        deadline: float = 0.0,
+    ):
+        self.queue = queue.Queue(max_queue)
         self.workers = []
         self.max_workers = max_workers
+        self.collector = collector
+        self.deadline = deadline
+
+        metrics.register('checker_queue_depth', lambda: [((), self.queue.qsize())])
 
     def start(self):
         for _ in range(self.max_workers):
-            worker = WorkerThread(self.queue)
+            worker = WorkerThread(self.queue, self.collector, self.deadline)
             worker.start()
             self.workers.append(worker)
 
@@ -543,19 +3032,39 @@ class ThreadPool:
             worker.stop()
             worker.join()
 
-    def add_task(self, task: socket.socket, *args):
-        self.queue.put((task, args))
+    def add_task(self, task: socket.socket, addr: t.Tuple[str, int]) -> bool:
+        try:
+            self.queue.put_nowait((task, addr, time.monotonic()))
+            return True
+        except queue.Full:
+            reject(task, 'queue_full')
+            return False
 
 
 class Server:
-    def __init__(self, host: str, port: int, num_workers: int = 10):
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        num_workers: int = 10,
+        collector: t.Optional[StateCollector] = None,
+        reuse_port: bool = False,
+        backlog: int = 128,
+        max_queue: int = 0,
+        deadline: float = 0.0,
+    ):
         self.host = host
         self.port = port
+        self.collector = collector
+        self.backlog = backlog
 
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
-        self.pool = ThreadPool(num_workers)
+        if reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        self.pool = ThreadPool(num_workers, collector, max_queue, deadline)
         self.pool.start()
 
     def handle(self, client, addr) -> None:
@@ -563,7 +3072,10 @@ class Server:
 
     def run(self) -> None:
         self.socket.bind((self.host, self.port))
-        self.socket.listen(5)
+        self.socket.listen(self.backlog)
+
+        if self.collector and not self.collector.is_alive():
+            self.collector.start()
 
         logger.info('Server started on %s:%s' % (self.host, self.port))
 
@@ -576,10 +3088,240 @@ class Server:
             pass
 
         finally:
+            if self.collector:
+                self.collector.stop()
+
             self.socket.close()
             logger.info('Server stopped')
 
 
+class AsyncServer:
+    MAX_REQUEST_SIZE = 8192 * 8
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        num_workers: int = 10,
+        collector: t.Optional[StateCollector] = None,
+        reuse_port: bool = False,
+        backlog: int = 128,
+    ):
+        self.host = host
+        self.port = port
+        self.collector = collector
+        self.reuse_port = reuse_port
+        self.backlog = backlog
+        self.executor = ThreadPoolExecutor(num_workers)
+
+    @staticmethod
+    def is_keep_alive(head: bytes) -> bool:
+        lines = head.split(b'\r\n')
+        version = lines[0].rsplit(b' ', 1)[-1].upper()
+
+        for line in lines[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'connection':
+                return value.strip().lower() != b'close'
+
+        return version == b'HTTP/1.1'
+
+    @staticmethod
+    def content_length(head: bytes) -> int:
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length' and value.strip().isdigit():
+                return int(value.strip())
+
+        return 0
+
+    async def read_request(self, reader: asyncio.StreamReader) -> t.Optional[bytes]:
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = self.content_length(head)
+            if length > self.MAX_REQUEST_SIZE:
+                return None
+
+            return head + await reader.readexactly(length)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            return None
+
+    async def execute(self, data: bytes) -> t.Any:
+        request = ParserServerRequest(data.strip())
+        request.parse()
+
+        function_executor = FunctionExecutor.of(request, self.collector)
+        if not function_executor.is_blocking:
+            return function_executor.execute()
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function_executor.execute)
+
+    async def stream(
+        self, writer: asyncio.StreamWriter, response: StreamResponse, keep_alive: bool
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        chunks = response.chunks()
+        writer.write(response.head(keep_alive))
+
+        while True:
+            chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            if chunk is None:
+                break
+
+            writer.write(chunk)
+            await writer.drain()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        addr = writer.get_extra_info('peername')
+        logger.info('Client connected: %s' % (addr,))
+        started = False
+
+        try:
+            while True:
+                data = await self.read_request(reader)
+                if not data:
+                    break
+
+                keep_alive = self.is_keep_alive(data.split(b'\r\n\r\n', 1)[0])
+                response = await self.execute(data)
+
+                if isinstance(response, Subscription):
+                    sock = writer.get_extra_info('socket')
+                    response.attach(socket.fromfd(sock.fileno(), sock.family, sock.type))
+                    break
+
+                if isinstance(response, StreamResponse):
+                    started = True
+                    await self.stream(writer, response, keep_alive)
+                    started = False
+                else:
+                    writer.write(build_response(response, keep_alive=keep_alive))
+                    await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, OSError) as e:
+            logger.error(e)
+            metrics.inc('checker_errors_total', (('source', 'request'),))
+        except Exception as e:
+            logger.error(e)
+            metrics.inc('checker_errors_total', (('source', 'request'),))
+
+            # A response that already started streaming can only be cut short.
+            if not started:
+                writer.write(
+                    build_response({'error': 'Internal error'}, '500 Internal Server Error')
+                )
+        finally:
+            writer.close()
+            logger.info('Client disconnected: %s' % (addr,))
+
+    async def serve(self) -> None:
+        server = await asyncio.start_server(
+            self.handle,
+            self.host,
+            self.port,
+            reuse_address=True,
+            reuse_port=self.reuse_port or None,
+            backlog=self.backlog,
+            limit=self.MAX_REQUEST_SIZE,
+        )
+
+        logger.info('Server started on %s:%s' % (self.host, self.port))
+
+        async with server:
+            await server.serve_forever()
+
+    def run(self) -> None:
+        if self.collector and not self.collector.is_alive():
+            self.collector.start()
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.collector:
+                self.collector.stop()
+
+            self.executor.shutdown(wait=False)
+            logger.info('Server stopped')
+
+
+class ProcessSupervisor:
+    RESTART_DELAY = 1.0
+
+    slot = 0
+
+    def __init__(self, processes: int, target: t.Callable[[], None]):
+        self.processes = processes
+        self.target = target
+
+        self.children = {}
+        self.is_running = False
+
+    def spawn(self, slot: int) -> int:
+        pid = os.fork()
+
+        if pid == 0:
+            ProcessSupervisor.slot = slot
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+            code = 0
+            try:
+                self.target()
+            except BaseException as e:
+                logger.error('Worker process %d failed: %s' % (os.getpid(), e))
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.children[pid] = (time.monotonic(), slot)
+        logger.info('Worker process started: %d' % pid)
+        return pid
+
+    def stop(self, *args) -> None:
+        self.is_running = False
+
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        self.is_running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for slot in range(self.processes):
+            self.spawn(slot)
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            child = self.children.pop(pid, None)
+            if child is None or not self.is_running:
+                continue
+
+            started_at, slot = child
+            logger.warning('Worker process %d exited with status %d' % (pid, status))
+            if time.monotonic() - started_at < self.RESTART_DELAY:
+                time.sleep(self.RESTART_DELAY)
+
+            if self.is_running:
+                self.spawn(slot)
+
+        logger.info('Server stopped')
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Check user v%s' % __version__,
@@ -591,6 +3333,37 @@ def main():
 
     parser.add_argument('--run', action='store_true', help='Run server')
     parser.add_argument('--workers', type=int, default=10, help='Number of workers')
+    parser.add_argument(
+        '--processes',
+        type=int,
+        help='Number of server processes sharing the port with SO_REUSEPORT',
+    )
+    parser.add_argument('--backlog', type=int, help='Listen backlog')
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        help='Connections waiting for a worker before answering 503 (0 is unbounded)',
+    )
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        help='Seconds a queued request may wait before it is dropped (0 disables it)',
+    )
+    parser.add_argument(
+        '--result-ttl',
+        type=float,
+        help='Seconds to reuse a CHECK result for repeated requests (0 disables it)',
+    )
+    parser.add_argument(
+        '--engine',
+        choices=['thread', 'asyncio'],
+        help='Server engine (thread pool or asyncio with keep-alive)',
+    )
+    parser.add_argument(
+        '--interval',
+        type=float,
+        help='Seconds between state collections (0 disables the collector)',
+    )
 
     parser.add_argument('--create-service', action='store_true', help='Create service')
     parser.add_argument('--remove-service', action='store_true', help='Remove service')
@@ -602,6 +3375,47 @@ def main():
 
     parser.add_argument('--kill', action='store_true', help='Kill user')
 
+    parser.add_argument(
+        '--history',
+        type=int,
+        metavar='SAMPLES',
+        help='Connection count samples kept per user for /HISTORY (0 disables it)',
+    )
+    parser.add_argument(
+        '--persist',
+        type=float,
+        metavar='SECONDS',
+        help='Save the state for warm restarts every SECONDS (0 disables it)',
+    )
+    parser.add_argument(
+        '--enforce',
+        type=float,
+        nargs='?',
+        const=2.0,
+        metavar='INTERVAL',
+        help='Kill the newest sessions over the connection limit every INTERVAL seconds (0=off)',
+    )
+
+    parser.add_argument(
+        '--ssh-collector',
+        choices=['proc', 'netlink'],
+        help='Count SSH sessions from sshd processes or from sockets via netlink sock_diag',
+    )
+    parser.add_argument(
+        '--ssh-ports',
+        type=int,
+        nargs='+',
+        help='SSH ports for the netlink collector (default: ports sshd/dropbear listen on)',
+    )
+
+    parser.add_argument('--limiter-path', type=str, help='Connection limit file (text or SQLite)')
+    parser.add_argument(
+        '--convert-limiter',
+        type=str,
+        metavar='TARGET',
+        help='Convert the text limit file to a SQLite file',
+    )
+
     parser.add_argument('--update', action='store_true', help='Update server')
     parser.add_argument('--check-update', action='store_true', help='Check update')
 
@@ -623,6 +3437,25 @@ def main():
     config = CheckerUserConfig()
     service = ServiceManager()
 
+    if args.limiter_path:
+        config.limiter_path = args.limiter_path
+
+    ConnectionLimitIndex.PATH = config.limiter_path
+
+    if args.ssh_collector:
+        config.ssh_collector = args.ssh_collector
+
+    if args.ssh_ports:
+        config.ssh_ports = args.ssh_ports
+
+    SocketIndex.PORTS = tuple(config.ssh_ports)
+    SSHManager.INDEX = SocketIndex if config.ssh_collector == 'netlink' else ProcessIndex
+
+    if args.convert_limiter:
+        total = SQLiteConnectionLimitIndex.convert(ConnectionLimitIndex.PATH, args.convert_limiter)
+        logger.info('Converted %d limits to %s' % (total, args.convert_limiter))
+        return
+
     if args.start_screen:
         service.stop()
 
@@ -679,20 +3512,52 @@ def main():
 
     if args.username:
         if args.kill:
-            if kill_user(args.username):
+            if kill_user(args.username)['success']:
                 logger.info('Kill user success')
             else:
                 logger.error('Kill user failed')
 
+        fields = select_fields(exclude=config.exclude)
+
         if args.json:
-            logger.info(json.dumps(check_user(args.username), indent=4))
+            logger.info(json.dumps(check_user(args.username, fields), indent=4))
             return
 
-        logger.info(check_user(args.username))
+        logger.info(check_user(args.username, fields))
 
     if args.port:
         config.port = args.port
 
+    if args.interval is not None:
+        config.interval = args.interval
+
+    if args.engine:
+        config.engine = args.engine
+
+    if args.result_ttl is not None:
+        config.result_ttl = args.result_ttl
+
+    if args.processes is not None:
+        config.processes = args.processes
+
+    if args.backlog is not None:
+        config.backlog = args.backlog
+
+    if args.max_queue is not None:
+        config.max_queue = args.max_queue
+
+    if args.deadline is not None:
+        config.deadline = args.deadline
+
+    if args.enforce is not None:
+        config.enforce = args.enforce
+
+    if args.history is not None:
+        config.history = args.history
+
+    if args.persist is not None:
+        config.persist = args.persist
+
     if args.exclude:
         config.exclude = args.exclude
 
@@ -707,10 +3572,93 @@ def main():
 
     if args.run:
         workers = args.workers
+        processes = max(config.processes, 1)
         logger.info('Workers: %s' % workers)
+        logger.info('Processes: %s' % processes)
+        logger.info('Collector interval: %s' % config.interval)
+        logger.info('Engine: %s' % config.engine)
+        logger.info('Enforce interval: %s' % config.enforce)
         logger.info('Run Socket server')
-        server = Server('0.0.0.0', config.port, workers)
-        server.run()
+
+        FunctionExecutor.single_flight.ttl = config.result_ttl
+        FunctionExecutor.exclude = config.exclude
+        OpenVPNManagementClient.persistent = processes == 1
+
+        def serve():
+            if processes > 1:
+                FunctionExecutor.metrics_peers = MetricsPeers(
+                    config.port, ProcessSupervisor.slot, processes
+                )
+                FunctionExecutor.metrics_peers.start()
+
+            collector = None
+            if config.interval > 0 or config.enforce > 0:
+                # /EVENTS and /HISTORY follow the connection counts even when responses
+                # exclude them.
+                fields = set(select_fields(exclude=config.exclude))
+                fields.add('count_connection')
+                if config.enforce > 0:
+                    fields.add('limit_connection')
+
+                interval = config.interval if config.interval > 0 else config.enforce
+                collector = StateCollector(interval, fields=select_fields(fields))
+
+            # Workers forward /EVENTS to the first process, which owns the only version counter.
+            address = b'\0checker-events-%d' % config.port if processes > 1 else None
+            if collector and address and ProcessSupervisor.slot != 0:
+                FunctionExecutor.event_hub = EventRelay(address)
+            elif collector:
+                FunctionExecutor.event_hub = EventHub(address)
+                collector.listeners.append(FunctionExecutor.event_hub.publish)
+                FunctionExecutor.event_hub.start()
+
+            if collector and config.history > 0:
+                FunctionExecutor.history = ConnectionHistory(config.history)
+                collector.listeners.append(FunctionExecutor.history.record)
+
+            if collector and config.persist > 0:
+                store = StateStore(
+                    os.path.join(os.path.dirname(config.path_config), 'state.bin'),
+                    config.persist,
+                    FunctionExecutor.history,
+                )
+
+                snapshot = store.load()
+                if snapshot is not None:
+                    collector.snapshot = snapshot
+                    logger.info('Restored %d users from %s' % (len(snapshot.users), store.path))
+
+                if ProcessSupervisor.slot == 0:
+                    collector.listeners.append(store.maybe_save)
+
+            # With several processes only the first one enforces, so sessions are killed once.
+            if config.enforce > 0 and ProcessSupervisor.slot == 0:
+                LimitEnforcer(collector, config.enforce).start()
+
+            reuse_port = processes > 1
+
+            if config.engine == 'asyncio':
+                server = AsyncServer(
+                    '0.0.0.0', config.port, workers, collector, reuse_port, config.backlog
+                )
+            else:
+                server = Server(
+                    '0.0.0.0',
+                    config.port,
+                    workers,
+                    collector,
+                    reuse_port,
+                    config.backlog,
+                    config.max_queue,
+                    config.deadline,
+                )
+
+            server.run()
+
+        if processes > 1:
+            ProcessSupervisor(processes, serve).run()
+        else:
+            serve()
 
     if args.start:
         if not service.is_created: